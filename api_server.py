@@ -1,62 +1,31 @@
-import http.client
+import asyncio
+import gzip
+import hashlib
 import json
-import time
-import traceback
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional
 
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
+import orjson
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
+from config.settings import settings
+from storage.index_version import read_index_version
+from storage.milvus_store import MilvusVectorStore
 from retrieval.retriever import RAGInterface
+from retrieval.context_packer import pack_context
+from serving.admission import AdmissionController, Overloaded
+from serving.answer_cache import AnswerCache
+from serving.llm_client import LLMClient, LLMError, LLMUnavailable
+from serving.readiness import Readiness, warmup
+from serving.semantic_cache import SemanticCache
+from serving.session_store import SessionStore, combine_turn_vectors
+from serving.singleflight import SingleFlight
 from prompt_template import auto_build_prompt
 
 
-class HttpsApi:
-    def __init__(self, host: str, key: str, model: str, timeout: int = 20, **kwargs: Any) -> None:
-        """Simple HTTPS API client for OpenAI-compatible chat completions."""
-        super().__init__(**kwargs)
-        self._host = host
-        self._key = key
-        self._model = model
-        self._timeout = timeout
-        self._kwargs = kwargs
-        self._cumulative_error = 0
-
-    def draw_sample(self, prompt: str | Any, *args: Any, **kwargs: Any) -> str:
-        if isinstance(prompt, str):
-            prompt = [{'role': 'user', 'content': prompt.strip()}]
-
-        while True:
-            try:
-                conn = http.client.HTTPSConnection(self._host, timeout=self._timeout)
-                payload = json.dumps({
-                    'max_tokens': self._kwargs.get('max_tokens', 4096),
-                    'top_p': self._kwargs.get('top_p', None),
-                    'temperature': self._kwargs.get('temperature', 1.0),
-                    'model': self._model,
-                    'messages': prompt,
-                })
-                headers = {
-                    'Authorization': f'Bearer {self._key}',
-                    'User-Agent': 'IRAG-Frontend/1.0',
-                    'Content-Type': 'application/json',
-                }
-                conn.request('POST', '/v1/chat/completions', payload, headers)
-                res = conn.getresponse()
-                data = res.read().decode('utf-8')
-                data = json.loads(data)
-                return data['choices'][0]['message']['content']
-            except Exception:
-                print(
-                    f'Error when calling LLM API: {traceback.format_exc()}.'
-                    f'You may check your API host and API key.'
-                )
-                time.sleep(2)
-                continue
-
-
 # -----------------------------
 # FastAPI app & global deps
 # -----------------------------
@@ -77,6 +46,7 @@ class AskRequest(BaseModel):
     top_k: int = 3
     mode: str = "expert"  # expert / customer / academic / json
     history: List[Message] = []
+    session_id: Optional[str] = None  # 服务端会话（POST /api/session 创建），传了就不需要 history
 
 
 class RefChunk(BaseModel):
@@ -88,17 +58,136 @@ class RefChunk(BaseModel):
 class AskResponse(BaseModel):
     answer: str
     refs: List[RefChunk]
+    retrieval: Dict[str, Any] = {}
+    session_id: Optional[str] = None
+
+
+class RetrieveRequest(BaseModel):
+    query: str
+    top_k: int = 5
+    filters: Optional[Dict[str, Any]] = None   # {"company": "AIA"}，值为列表时按 in 过滤
+    include_tables: bool = True                # False 时不返回表格结构（只保留 text / score / metadata）
+    budget_ms: Optional[float] = None          # 默认 settings.RETRIEVE_BUDGET_MS
+
+
+class RetrieveBatchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    filters: Optional[Dict[str, Any]] = None
+    include_tables: bool = True
+
+
+# RAG 组件（模型 + Milvus 连接）：默认在后台加载，进程启动后立即开始监听端口；
+# gunicorn preload 模式下在 master 里 import 时加载（见 gunicorn.conf.py）
+rag: Optional[RAGInterface] = None
+readiness = Readiness()
+
+
+def _load_models() -> None:
+    global rag
+    if rag is None:
+        rag = RAGInterface()
+
+
+if not settings.API_BACKGROUND_LOAD:
+    readiness.set("loading")
+    _load_models()
+
+# LLM 配置来自环境变量（LLM_HOST / LLM_MODEL / LLM_API_KEY，见 .env）
+llm_client = LLMClient()
+
+# 有界回答缓存，可持久化到 SQLite（多 worker 共享）
+answer_cache = AnswerCache()
+
+# 近义问题复用回答；引用的 chunk 被删除 / 替换后自动失效
+semantic_cache = SemanticCache(id_checker=lambda ids: rag.store.existing_ids(ids))
+
+# 相同问题的并发请求合并为一次检索 + LLM 调用
+singleflight = SingleFlight()
+
+# 按阶段（推理 / LLM）限制并发，排队有上限，过载时快速失败
+admission = AdmissionController()
+
+# 服务端多轮会话：历史问答 + 每轮问题向量，客户端只需发 session_id
+sessions = SessionStore()
+
+
+_bootstrap_task: Optional[asyncio.Task] = None
+
+
+async def _bootstrap() -> None:
+    """在 worker 的 event loop 里：加载模型（若尚未加载）→ 预热 → ready"""
+    loop = asyncio.get_running_loop()
+    try:
+        if rag is None:
+            readiness.set("loading")
+            await loop.run_in_executor(None, _load_models)
 
+        readiness.set("warming")
+        queries = [q.strip() for q in settings.WARMUP_QUERIES.split("|") if q.strip()]
+        await warmup(rag, queries, llm_client=llm_client if settings.WARMUP_LLM else None)
 
-# Initialize RAG + LLM client once at startup
-rag = RAGInterface()
+        readiness.set("ready")
+    except Exception as e:
+        print(f"❌ 启动失败: {e!r}")
+        readiness.fail(e)
 
-# NOTE: these should ideally come from environment variables or config
-LLM_HOST = "api.bltcy.top"
-LLM_KEY = "sk-Clt5fdhN9xAT9sk2aj6MRCEgF8Zv7ahy3KQP1RK5PqHRGpCP"
-LLM_MODEL = "gpt-4o-mini-2024-07-18"
-http_client = HttpsApi(host=LLM_HOST, key=LLM_KEY, model=LLM_MODEL)
-LLM_CACHE: Dict[str, str] = {}
+
+@app.on_event("startup")
+async def start_bootstrap() -> None:
+    global _bootstrap_task
+    _bootstrap_task = asyncio.create_task(_bootstrap())
+
+
+@app.on_event("shutdown")
+async def close_llm_client() -> None:
+    await llm_client.aclose()
+
+
+@app.get("/healthz")
+async def healthz() -> JSONResponse:
+    """存活探针：进程在跑就是 200；启动失败（模型 / Milvus 加载出错）时 503"""
+    return JSONResponse(status_code=200 if readiness.alive else 503, content=readiness.stats())
+
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    """就绪探针：模型加载且预热完成后才是 200"""
+    return JSONResponse(status_code=200 if readiness.ready else 503, content=readiness.stats())
+
+
+def _require_ready() -> None:
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service is {readiness.state}",
+            headers={"Retry-After": "5"},
+        )
+
+
+@app.get("/api/metrics")
+async def metrics() -> Dict[str, Any]:
+    """缓存命中率与 LLM 客户端状态"""
+    return {
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "result_cache": rag.result_cache.stats() if rag is not None else None,
+        "llm": llm_client.stats(),
+        "singleflight": singleflight.stats(),
+        "admission": admission.stats(),
+        "readiness": readiness.stats(),
+        "sessions": sessions.stats(),
+    }
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded) -> JSONResponse:
+    """队列已满 → 429，排队超时 → 503，均带 Retry-After"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": f"Server busy ({exc.stage}), please retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 @app.get("/")
@@ -107,6 +196,220 @@ async def index() -> FileResponse:
     return FileResponse("frontend/index.html")
 
 
+# -----------------------------
+# 服务端会话
+# -----------------------------
+
+@app.post("/api/session")
+async def create_session() -> Dict[str, Any]:
+    """新建会话；之后 /api/ask 只需带 session_id + question"""
+    loop = asyncio.get_running_loop()
+    session_id = await loop.run_in_executor(None, sessions.create)
+    return {"session_id": session_id, "ttl": sessions.ttl}
+
+
+@app.get("/api/session/{session_id}")
+async def get_session(session_id: str) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    turns = await loop.run_in_executor(None, sessions.load, session_id)
+    if turns is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {
+        "session_id": session_id,
+        "turns": [
+            {"question": t["question"], "answer": t["answer"], "chunk_ids": t["chunk_ids"]}
+            for t in turns
+        ],
+    }
+
+
+@app.delete("/api/session/{session_id}")
+async def delete_session(session_id: str) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    deleted = await loop.run_in_executor(None, sessions.delete, session_id)
+    return {"session_id": session_id, "deleted": deleted}
+
+
+def _ref_dict(r: Dict[str, Any]) -> Dict[str, Any]:
+    """检索结果 → 前端展示用的 ref（表格块没有 text，用空串）"""
+    return {"text": r.get("text") or "", "score": r["score"], "metadata": r.get("metadata") or {}}
+
+
+async def _prepare(req: AskRequest) -> Dict[str, Any]:
+    """
+    检索 + 组装当前轮 messages。
+    返回 {"answer", "refs", "retrieval", "results", "messages", "cache_key", "q_vec"}；
+    缓存命中时 answer 已有值，无需再调用 LLM。
+    """
+    loop = asyncio.get_running_loop()
+
+    # 0) 历史对话：有 session_id 时从服务端会话读取，否则用请求里的 history
+    turns = None
+    if req.session_id:
+        turns = await loop.run_in_executor(None, sessions.load, req.session_id)
+        if turns is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        history = []
+        for t in turns:
+            history.append({"role": "user", "content": t["question"]})
+            history.append({"role": "assistant", "content": t["answer"]})
+    else:
+        history = [
+            {"role": m.role, "content": m.content}
+            for m in (req.history or [])
+            if m.role in {"user", "assistant", "system"}
+        ]
+
+    # 1) 构建用于检索的 query（最近若干轮用户问题 + 当前问题）：
+    #    BM25 / TAPAS / rerank / query 扩展都用这段文本，"那第二条呢？"这类追问才有上下文；
+    #    会话请求取最近 SESSION_QUERY_TURNS 轮（与合并问题向量的轮数一致），旧的 history 请求取 3 轮
+    if req.session_id:
+        n = settings.SESSION_QUERY_TURNS
+        recent_user_questions = [t["question"] for t in turns[-n:]] if n else []
+    else:
+        history_user_questions = [m["content"] for m in history if m["role"] == "user"]
+        recent_user_questions = history_user_questions[-3:]  # 只取最近 3 轮用户问题
+    rag_query = "\n".join(recent_user_questions + [req.question])
+
+    # 1.5) + 2) 占用一个推理槽位：问题 embedding、检索、rerank 都在这里
+    async with admission.inference.slot():
+        # 只 embedding 当前问题：会话里记录每轮的问题向量，语义缓存也用它查找
+        q_vec = None
+        if req.session_id or (not history and semantic_cache.enabled):
+            q_vec = await rag.aembed_query(req.question)
+
+        # 语义缓存（仅无 history 时）
+        if q_vec is not None and not history and semantic_cache.enabled:
+            hit = await loop.run_in_executor(None, semantic_cache.lookup, q_vec, req.mode, req.top_k)
+            if hit is not None:
+                return {
+                    "answer": hit["answer"],
+                    "refs": hit["refs"],
+                    "retrieval": {"path": "semantic_cache", "similarity": hit["similarity"]},
+                    "results": [],
+                    "q_vec": q_vec,
+                }
+
+        # 会话多轮：当前问题向量与最近几轮的问题向量衰减加权合并，不再重新 embedding 拼接文本
+        text_vector, vector_tag = q_vec, None
+        if turns:
+            n = settings.SESSION_QUERY_TURNS
+            text_vector = combine_turn_vectors(q_vec, [t["q_vec"] for t in turns[-n:]] if n else [])
+            # 合并向量 ≠ 当前问题的 embedding，结果缓存 key 需区分
+            vector_tag = hashlib.sha1(text_vector.tobytes()).hexdigest()
+
+        # RAG 检索（协程版本，不阻塞 event loop；可配置延迟预算）
+        results, retrieval_info = await rag.aretrieve(
+            rag_query,
+            top_k=req.top_k,
+            budget_ms=settings.RETRIEVE_BUDGET_MS or None,
+            with_info=True,
+            text_vector=text_vector,
+            vector_tag=vector_tag,
+        )
+
+    # 3) 构建参考文本列表（同页合并去重叠、表格紧凑渲染、按 token 预算截取）
+    ref_texts = [t + "\n" for t in pack_context(results, settings.CONTEXT_MAX_TOKENS)]
+
+    # 4) 构建当前轮 Prompt（包含当前问题 + 参考内容）
+    prompt = auto_build_prompt(req.question, ref_texts, mode=req.mode)
+
+    # 5) 组合多轮对话 messages：history 在前，当前轮在最后
+    messages = history + [{"role": "user", "content": prompt}]
+
+    # 6) 回答缓存：仅在无 history 时缓存；key 含索引版本号与本次检索到的 refs
+    cache_key = None
+    answer = None
+    if not history:
+        cache_key = AnswerCache.make_key(
+            llm_client.model, req.mode, req.question, read_index_version(), results
+        )
+        answer = await loop.run_in_executor(None, answer_cache.get, cache_key)
+
+    return {
+        "answer": answer,
+        "refs": [_ref_dict(r) for r in results],
+        "retrieval": retrieval_info,
+        "results": results,
+        "messages": messages,
+        "cache_key": cache_key,
+        "q_vec": q_vec,
+    }
+
+
+async def _remember(req: AskRequest, ctx: Dict[str, Any], answer_text: str) -> None:
+    """LLM 新生成的回答写入缓存"""
+    if ctx["cache_key"] is not None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, answer_cache.set, ctx["cache_key"], answer_text)
+
+    # 写入语义缓存（仅无 history；记录引用的 chunk id，供索引更新后校验）
+    results = ctx["results"]
+    if ctx["cache_key"] is not None and ctx["q_vec"] is not None and results and ctx["retrieval"].get("path") in ("rerank", "fusion_margin", "cache"):
+        semantic_cache.add(
+            ctx["q_vec"],
+            req.mode,
+            req.top_k,
+            answer_text,
+            refs=ctx["refs"],
+            chunk_ids=[r["id"] for r in results],
+        )
+
+
+async def _record_turn(req: AskRequest, ctx: Dict[str, Any], answer_text: str) -> None:
+    """本轮问答（含问题向量、检索到的 chunk id）追加到服务端会话"""
+    if not req.session_id or not answer_text:
+        return
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        None,
+        sessions.append,
+        req.session_id,
+        req.question,
+        answer_text,
+        ctx.get("q_vec"),
+        [r["id"] for r in ctx.get("results") or []],
+    )
+
+
+def _llm_http_error(e: LLMError) -> HTTPException:
+    if isinstance(e, LLMUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail="LLM service temporarily unavailable",
+            headers={"Retry-After": str(max(1, int(e.retry_after or 1)))},
+        )
+    return HTTPException(status_code=502, detail=f"LLM call failed: {e}")
+
+
+def _flight_key(req: AskRequest) -> str:
+    """问题 + 参数 + history / 会话完全相同的请求才合并"""
+    raw = json.dumps(
+        [
+            req.question.strip(), req.mode, req.top_k, req.session_id,
+            [[m.role, m.content] for m in req.history or []],
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def _answer(req: AskRequest) -> Dict[str, Any]:
+    ctx = await _prepare(req)
+
+    answer_text = ctx["answer"]
+    if answer_text is None:
+        try:
+            async with admission.llm.slot():
+                answer_text = await llm_client.chat(ctx["messages"])
+        except LLMError as e:
+            raise _llm_http_error(e)
+        await _remember(req, ctx, answer_text)
+
+    await _record_turn(req, ctx, answer_text)
+    return {"answer": answer_text, "refs": ctx["refs"], "retrieval": ctx["retrieval"]}
+
+
 @app.post("/api/ask", response_model=AskResponse)
 async def ask(req: AskRequest) -> AskResponse:
     """Main QA endpoint for the frontend.
@@ -115,46 +418,137 @@ async def ask(req: AskRequest) -> AskResponse:
     2) 用 prompt_template 生成当前轮 Prompt；
     3) 将历史对话 + 当前 Prompt 一起发送给 LLM 生成答案。
     """
-    # 1) 构建用于检索的 query（最近若干轮用户问题 + 当前问题）
-    history_user_questions = [
-        m.content for m in (req.history or []) if m.role == "user"
-    ]
-    recent_user_questions = history_user_questions[-3:]  # 只取最近 3 轮用户问题
-    rag_query_parts = recent_user_questions + [req.question]
-    rag_query = "\n".join(rag_query_parts)
+    _require_ready()
+    result, shared = await singleflight.do(_flight_key(req), lambda: _answer(req))
 
-    # 2) RAG 检索
-    results = rag.retrieve(rag_query, top_k=req.top_k)
+    retrieval = dict(result["retrieval"])
+    if shared:
+        retrieval["coalesced"] = True
 
-    # 3) 构建参考文本列表
-    ref_texts = [r["text"] + "\n" for r in results]
+    converted_refs = [RefChunk(**r) for r in result["refs"]]
+    return AskResponse(
+        answer=result["answer"], refs=converted_refs, retrieval=retrieval, session_id=req.session_id
+    )
 
-    # 4) 构建当前轮 Prompt（包含当前问题 + 参考内容）
-    prompt = auto_build_prompt(req.question, ref_texts, mode=req.mode)
 
-    # 5) 组合多轮对话 messages：history 在前，当前轮在最后
-    history_messages = [
-        {"role": m.role, "content": m.content}
-        for m in (req.history or [])
-        if m.role in {"user", "assistant", "system"}
-    ]
-    messages = history_messages + [{"role": "user", "content": prompt}]
-
-    # 6) 调用 LLM（带简单缓存：仅在无 history 时缓存同一问题的回答）
-    cache_key = None
-    if not req.history:
-        cache_key = json.dumps(
-            {"q": req.question, "mode": req.mode, "top_k": req.top_k},
-            ensure_ascii=False,
-            sort_keys=True,
+# -----------------------------
+# 纯检索接口（不调用 LLM）
+# -----------------------------
+
+def _fast_json(request: Request, payload: Any) -> Response:
+    """orjson 序列化，绕过 pydantic 响应模型；客户端支持且响应较大时 gzip 压缩"""
+    body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= settings.GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _check_filters(filters: Optional[Dict[str, Any]]) -> None:
+    """filters 会拼进 Milvus 过滤表达式：非法的 key / 值类型直接返回 400"""
+    try:
+        MilvusVectorStore.filter_expr(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _hits(results: List[Dict[str, Any]], include_tables: bool) -> List[Dict[str, Any]]:
+    if include_tables:
+        return results
+    return [{k: v for k, v in r.items() if k != "table"} for r in results]
+
+
+@app.post("/api/retrieve")
+async def retrieve(req: RetrieveRequest, request: Request) -> Response:
+    """RAGInterface.retrieve 的 HTTP 版本：返回 {"results", "retrieval"}"""
+    _require_ready()
+    _check_filters(req.filters)
+    budget_ms = req.budget_ms if req.budget_ms is not None else settings.RETRIEVE_BUDGET_MS
+    async with admission.inference.slot():
+        results, info = await rag.aretrieve(
+            req.query,
+            top_k=req.top_k,
+            filters=req.filters,
+            budget_ms=budget_ms or None,
+            with_info=True,
         )
-    if cache_key is not None and cache_key in LLM_CACHE:
-        answer_text = LLM_CACHE[cache_key]
-    else:
-        answer_text = http_client.draw_sample(prompt=messages)
-        if cache_key is not None:
-            LLM_CACHE[cache_key] = answer_text
+    return _fast_json(request, {"results": _hits(results, req.include_tables), "retrieval": info})
+
+
+@app.post("/api/retrieve/batch")
+async def retrieve_batch(req: RetrieveBatchRequest, request: Request) -> Response:
+    """RAGInterface.retrieve_batch 的 HTTP 版本：results[i] 对应 queries[i]"""
+    _require_ready()
+    if len(req.queries) > settings.RETRIEVE_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many queries: {len(req.queries)} > {settings.RETRIEVE_BATCH_MAX}",
+        )
+    _check_filters(req.filters)
+
+    # 整批占一个推理槽位；批量 embedding / rerank 是同步调用，放到线程池里跑
+    async with admission.inference.slot():
+        loop = asyncio.get_running_loop()
+        outputs = await loop.run_in_executor(
+            None, rag.retrieve_batch, req.queries, req.top_k, req.filters
+        )
+    return _fast_json(request, {"results": [_hits(r, req.include_tables) for r in outputs]})
 
-    # 7) 返回统一结构
-    converted_refs = [RefChunk(**r) for r in results]
-    return AskResponse(answer=answer_text, refs=converted_refs)
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/ask/stream")
+async def ask_stream(req: AskRequest) -> StreamingResponse:
+    """/api/ask 的流式版本（SSE）。
+
+    事件顺序：
+        refs   —— 检索完成后立即发送 {"refs", "retrieval", "session_id"}
+        token  —— LLM 增量输出 {"delta"}（缓存命中时整段回答作为一个 token）
+        done   —— {"answer"} 完整回答
+        error  —— {"status", "detail"}，出错时代替 done
+    """
+    _require_ready()
+
+    # SSE 开始后就无法再返回 429，LLM 队列已满时在检索之前就拒绝
+    if admission.llm.full():
+        raise Overloaded(admission.llm.name, 429, admission.llm.retry_after())
+
+    ctx = await _prepare(req)
+
+    async def events():
+        yield _sse("refs", {"refs": ctx["refs"], "retrieval": ctx["retrieval"], "session_id": req.session_id})
+
+        if ctx["answer"] is not None:
+            await _record_turn(req, ctx, ctx["answer"])
+            yield _sse("token", {"delta": ctx["answer"]})
+            yield _sse("done", {"answer": ctx["answer"]})
+            return
+
+        parts = []
+        try:
+            async with admission.llm.slot():
+                async for delta in llm_client.stream_chat(ctx["messages"]):
+                    parts.append(delta)
+                    yield _sse("token", {"delta": delta})
+        except LLMError as e:
+            err = _llm_http_error(e)
+            yield _sse("error", {"status": err.status_code, "detail": err.detail})
+            return
+        except Overloaded as e:
+            yield _sse("error", {"status": e.status_code, "detail": str(e), "retry_after": e.retry_after})
+            return
+
+        # 客户端中途断开时生成器被关闭，不会走到这里，半截回答不会进缓存
+        answer_text = "".join(parts)
+        await _remember(req, ctx, answer_text)
+        await _record_turn(req, ctx, answer_text)
+        yield _sse("done", {"answer": answer_text})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -9,10 +9,100 @@ class Settings:
    MILVUS_HOST: str = os.getenv("MILVUS_HOST", "127.0.0.1")
    MILVUS_PORT: int = int(os.getenv("MILVUS_PORT", 19530))
    MILVUS_COLLECTION: str = os.getenv("MILVUS_COLLECTION", "IRAG")
+   MILVUS_ALIAS: str = os.getenv("MILVUS_ALIAS", "IRAG_MM")  # 线上读的 alias / collection 名
+   MILVUS_RETAIN_VERSIONS: int = int(os.getenv("MILVUS_RETAIN_VERSIONS", 2))
+   REBUILD_MIN_ROW_RATIO: float = float(os.getenv("REBUILD_MIN_ROW_RATIO", 0.9))
+   REBUILD_SMOKE_QUERIES: list = [
+      q for q in os.getenv(
+         "REBUILD_SMOKE_QUERIES", "意外医疗保险如何理赔？|重疾险的等待期通常是多久？"
+      ).split("|") if q
+   ]
+   SOURCE_DIR: str = os.getenv("SOURCE_DIR", "sourcepdf")   # PDF 根目录，doc_id 是相对它的路径
    MILVUS_DIM: int = int(os.getenv("MILVUS_DIM", 768))
    MILVUS_METRIC_TYPE: str = os.getenv("MILVUS_METRIC_TYPE", "IP")
-   MILVUS_INDEX_TYPE: str = os.getenv("MILVUS_INDEX_TYPE", "IVF_FLAT")
+   MILVUS_INDEX_TYPE: str = os.getenv("MILVUS_INDEX_TYPE", "HNSW")  # 见 storage/index_profiles.py
    EMBEDDING_MODEL_NAME: str = os.getenv("EMBEDDING_MODEL_NAME", "all-mpnet-base-v2")
    DEFAULT_TOP_K: int = int(os.getenv("DEFAULT_TOP_K", 5))
+   TEXT_CHANNEL_TIMEOUT: float = float(os.getenv("TEXT_CHANNEL_TIMEOUT", 10))    # 秒
+   TABLE_CHANNEL_TIMEOUT: float = float(os.getenv("TABLE_CHANNEL_TIMEOUT", 10))  # 秒
+   RETRIEVE_WORKERS: int = int(os.getenv("RETRIEVE_WORKERS", 4))
+   INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", 2))  # aretrieve 推理线程数
+   RERANKER_MODEL: str = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
+   RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", 16))
+   RERANK_CACHE_SIZE: int = int(os.getenv("RERANK_CACHE_SIZE", 50000))
+   RETRIEVE_BUDGET_MS: float = float(os.getenv("RETRIEVE_BUDGET_MS", 0))   # 0 = 不限
+   RERANK_MS_PER_ITEM: float = float(os.getenv("RERANK_MS_PER_ITEM", 15))  # 初始估计
+   RERANK_BUDGET_SHARE: float = float(os.getenv("RERANK_BUDGET_SHARE", 0.5))
+   RERANK_SKIP_MARGIN: float = float(os.getenv("RERANK_SKIP_MARGIN", 0.5))
+   PASSAGE_TOKEN_DB: str = os.getenv("PASSAGE_TOKEN_DB", "data/passage_tokens.sqlite3")
+   RESULT_CACHE_SIZE: int = int(os.getenv("RESULT_CACHE_SIZE", 2048))
+   RESULT_CACHE_TTL: float = float(os.getenv("RESULT_CACHE_TTL", 0))   # 秒，0 = 只靠索引版本失效
+   INDEX_VERSION_PATH: str = os.getenv("INDEX_VERSION_PATH", "data/index_version.json")
+   # 表格通道的查询向量：tapas = 查询时跑 TAPAS；text = 复用 bge-m3 查询向量
+   # 检索线性化表格的 bge-m3 向量（table_text_vector），查询进程不加载 TAPAS
+   TABLE_QUERY_MODE: str = os.getenv("TABLE_QUERY_MODE", "tapas")
+   # retrieve_batch：每次 embedding 的条数、每次 Milvus 多向量搜索的向量数
+   EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", 32))
+   SEARCH_BATCH_SIZE: int = int(os.getenv("SEARCH_BATCH_SIZE", 64))
+   # /api/retrieve/batch：单次请求最多多少个 query；响应超过多少字节才 gzip
+   RETRIEVE_BATCH_MAX: int = int(os.getenv("RETRIEVE_BATCH_MAX", 64))
+   GZIP_MIN_BYTES: int = int(os.getenv("GZIP_MIN_BYTES", 1024))
+   # 多 worker 部署（gunicorn.conf.py）
+   API_BIND: str = os.getenv("API_BIND", "0.0.0.0:8000")
+   API_WORKERS: int = int(os.getenv("API_WORKERS", 2))
+   API_PRELOAD: bool = os.getenv("API_PRELOAD", "1") not in ("0", "false", "False")
+   TORCH_THREADS_PER_WORKER: int = int(os.getenv("TORCH_THREADS_PER_WORKER", 0))  # 0 = CPU 核数 / worker 数
+   # 启动：后台加载模型（先绑定端口），worker 内用 WARMUP_QUERIES（"|" 分隔）预热后 /readyz 才返回 200
+   API_BACKGROUND_LOAD: bool = os.getenv("API_BACKGROUND_LOAD", "1") not in ("0", "false", "False")
+   WARMUP_QUERIES: str = os.getenv("WARMUP_QUERIES", "丰逸行是什么|意外医疗保险如何理赔？")
+   WARMUP_LLM: bool = os.getenv("WARMUP_LLM", "0") not in ("0", "false", "False")   # 预热时调用一次 LLM（计费）
+   # LLM（OpenAI 兼容 chat completions），见 serving/llm_client.py
+   LLM_HOST: str = os.getenv("LLM_HOST", "api.bltcy.top")
+   LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4o-mini-2024-07-18")
+   LLM_API_KEY: str = os.getenv("LLM_API_KEY", "")
+   LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", 20))              # 单次请求（秒）
+   LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+   LLM_DEADLINE: float = float(os.getenv("LLM_DEADLINE", 45))            # 含重试（秒）
+   LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", 2))
+   LLM_BACKOFF_BASE: float = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+   LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+   LLM_BREAKER_THRESHOLD: int = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+   LLM_BREAKER_RESET: float = float(os.getenv("LLM_BREAKER_RESET", 30))
+   LLM_MAX_TOKENS: int = int(os.getenv("LLM_MAX_TOKENS", 4096))
+   LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", 1.0))
+   # 准入控制（serving/admission.py）：每个阶段的并发上限与排队上限，队列满时直接返回 429
+   ADMISSION_INFERENCE_CONCURRENCY: int = int(os.getenv("ADMISSION_INFERENCE_CONCURRENCY", 4))  # embedding / 检索 / rerank
+   ADMISSION_INFERENCE_QUEUE: int = int(os.getenv("ADMISSION_INFERENCE_QUEUE", 16))
+   ADMISSION_LLM_CONCURRENCY: int = int(os.getenv("ADMISSION_LLM_CONCURRENCY", 0))   # 0 = LLM_MAX_CONCURRENCY
+   ADMISSION_LLM_QUEUE: int = int(os.getenv("ADMISSION_LLM_QUEUE", 32))
+   ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10))  # 排队超时（秒），超时返回 503
+   # LLM 回答缓存：内存 LRU + 可选 SQLite 持久层（DB 置空则只用内存）
+   ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+   ANSWER_CACHE_MAX_MB: int = int(os.getenv("ANSWER_CACHE_MAX_MB", 64))
+   ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", 86400))        # 秒，0 表示不过期
+   ANSWER_CACHE_DB: str = os.getenv("ANSWER_CACHE_DB", "data/answer_cache.sqlite3")
+   ANSWER_CACHE_DISK_ROWS: int = int(os.getenv("ANSWER_CACHE_DISK_ROWS", 100000))
+   # 语义答案缓存：近义问题复用回答（SIZE=0 关闭，TTL 单位秒，0 表示不过期）
+   SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+   SEMANTIC_CACHE_SIZE: int = int(os.getenv("SEMANTIC_CACHE_SIZE", 2000))
+   SEMANTIC_CACHE_TTL: float = float(os.getenv("SEMANTIC_CACHE_TTL", 86400))
+   # 服务端会话（serving/session_store.py）：DB 置空则只存在进程内存（多 worker 时不共享）
+   SESSION_DB: str = os.getenv("SESSION_DB", "data/sessions.sqlite3")
+   SESSION_TTL: float = float(os.getenv("SESSION_TTL", 3600))        # 秒，最后一次提问之后多久过期
+   SESSION_MAX: int = int(os.getenv("SESSION_MAX", 10000))           # 会话数上限
+   SESSION_MAX_TURNS: int = int(os.getenv("SESSION_MAX_TURNS", 20))  # 每个会话保留的轮数（拼入 messages）
+   SESSION_QUERY_TURNS: int = int(os.getenv("SESSION_QUERY_TURNS", 3))  # 检索时合并最近几轮的问题向量
+   SESSION_DECAY: float = float(os.getenv("SESSION_DECAY", 0.5))     # 往前每一轮的向量权重衰减
+   # 多 query 扩展（retrieval/query_expansion.py）：off / rules / llm；改写数不含原 query，改写的融合权重相对原 query
+   QUERY_EXPANSION: str = os.getenv("QUERY_EXPANSION", "off")
+   QUERY_EXPANSION_MAX: int = int(os.getenv("QUERY_EXPANSION_MAX", 3))
+   QUERY_EXPANSION_WEIGHT: float = float(os.getenv("QUERY_EXPANSION_WEIGHT", 0.6))
+   QUERY_EXPANSION_LLM_TIMEOUT: float = float(os.getenv("QUERY_EXPANSION_LLM_TIMEOUT", 3))  # 秒
+   # 参考资料的 token 预算（估计值），0 表示不限制
+   CONTEXT_MAX_TOKENS: int = int(os.getenv("CONTEXT_MAX_TOKENS", 3000))
+   BM25_INDEX_DIR: str = os.getenv("BM25_INDEX_DIR", "data/bm25")
+   BM25_WEIGHT: float = float(os.getenv("BM25_WEIGHT", 1.0))
+   TABLE_BLOB_DB: str = os.getenv("TABLE_BLOB_DB", "data/table_blobs.sqlite3")
+   TABLE_BLOB_CACHE_SIZE: int = int(os.getenv("TABLE_BLOB_CACHE_SIZE", 1024))
 
 settings = Settings()                          
\ No newline at end of file
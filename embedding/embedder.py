@@ -18,7 +18,7 @@
 """
 Embedder for IRAG multi-modal pipeline
 - 文本 → BGE / SentenceTransformer embedding
-- 表格 → TAPAS embedding (structure-aware)
+- 表格 → TAPAS embedding (structure-aware)，另可对线性化表格做 bge-m3 embedding
 """
 
 import torch
@@ -29,18 +29,6 @@ import pandas as pd
 
 
 class Embedder:
-<<<<<<< HEAD
-    def __init__(self):
-        device = "cpu"
-        if torch.cuda.is_available():
-            try:
-                _ = torch.randn(1, device="cuda")
-                device = "cuda"
-            except Exception:
-                device = "cpu"
-        self.model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME, device=device)
-=======
->>>>>>> 7baeaa1 (new-version-with-table)
 
     def __init__(self):
 
@@ -51,15 +39,22 @@ class Embedder:
         self.text_model.eval()
 
         # ----- 表格模型（TAPAS 论文级表格 embedding） -----
+        # 按需加载（load_table_model）：TABLE_QUERY_MODE=text 时查询进程完全不需要 TAPAS；
+        # tapas 模式下由 RAGInterface 构造时加载，preload 部署中随 fork 共享
         self.table_model_name = "google/tapas-base"
-        self.table_tokenizer = TapasTokenizer.from_pretrained(self.table_model_name)
-        self.table_model = TapasModel.from_pretrained(self.table_model_name)
-        self.table_model.eval()
+        self.table_tokenizer = None
+        self.table_model = None
 
         # 是否使用 GPU
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.text_model.to(self.device)
-        self.table_model.to(self.device)
+
+    def load_table_model(self):
+        if self.table_model is None:
+            self.table_tokenizer = TapasTokenizer.from_pretrained(self.table_model_name)
+            self.table_model = TapasModel.from_pretrained(self.table_model_name)
+            self.table_model.to(self.device)
+            self.table_model.eval()
 
 
 
@@ -67,12 +62,6 @@ class Embedder:
     # 文本 embedding
     # ----------------------------------------------------------------------
     def embed_text(self, texts):
-<<<<<<< HEAD
-        return np.array(self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False),dtype=np.float32)
-    
-    def embed_query(self, query):
-        return np.array(self.model.encode([query], convert_to_numpy=True, show_progress_bar=False),dtype=np.float32)[0]  # Load environment variables
-=======
         """
         输入: texts = [str, str, ...]
         输出: np.ndarray (N, dim)
@@ -92,6 +81,24 @@ class Embedder:
 
         return embeddings.cpu().numpy()
 
+    def embed_texts(self, texts, batch_size=32):
+        """
+        大批量文本 embedding：按长度排序后分批，减少 padding
+        输出: np.ndarray (N, dim)，顺序与输入一致
+        """
+        if not texts:
+            return np.zeros((0, self.text_model.config.hidden_size), dtype="float32")
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            part = order[start:start + batch_size]
+            vecs = self.embed_text([texts[i] for i in part])
+            for i, v in zip(part, vecs):
+                out[i] = v
+
+        return np.stack(out)
+
 
 
     # ----------------------------------------------------------------------
@@ -109,7 +116,7 @@ class Embedder:
         输出: np.ndarray (dim=768)
         """
 
-        
+        self.load_table_model()
 
         # --- 1. 构造 DataFrame（TAPAS 需要） ---
         df = pd.DataFrame(rows, columns=headers)
@@ -132,8 +139,11 @@ class Embedder:
     def embed_query_table(self, query: str):
         """
         将 query 转成 TAPAS 所需的 DataFrame 格式
+        （仅 TABLE_QUERY_MODE=tapas 时在查询路径上使用）
         """
 
+        self.load_table_model()
+
         # 用 DataFrame 更安全
         df = pd.DataFrame({"QUERY": [query]})
 
@@ -150,5 +160,3 @@ class Embedder:
             emb = outputs.pooler_output  # (1, dim)
 
         return emb.cpu().numpy()[0]
-
->>>>>>> 7baeaa1 (new-version-with-table)
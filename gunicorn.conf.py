@@ -0,0 +1,59 @@
+"""
+多 worker 部署：模型在 master 进程里只加载一次，fork 出的 worker 以 copy-on-write 方式共享权重
+
+    uv run gunicorn api_server:app -c gunicorn.conf.py
+
+- preload_app：master 先 import api_server，bge-m3 / TAPAS / reranker 只加载一份
+- when_ready：fork 之前 gc.freeze()，把已有对象移出 GC 扫描范围，
+  避免子进程里的 GC 写对象头导致共享页被复制
+- post_fork：每个 worker 重建 Milvus gRPC / SQLite 连接，并按 worker 数分配 torch 线程
+- 每个 worker 启动后跑 WARMUP_QUERIES 预热，完成前 /readyz 返回 503
+
+注意：
+- master 里不要跑模型推理（预热放在 worker 内），否则 OpenMP 线程池在 fork 后可能卡死
+- GPU 部署时 CUDA context 无法跨 fork 继承，请设置 API_PRELOAD=0（每个 worker 各自加载）
+"""
+
+import gc
+import os
+
+# 必须在 grpc 被 import 之前设置，否则 fork 后子进程的 gRPC 调用可能挂起
+os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "1")
+os.environ.setdefault("GRPC_POLL_STRATEGY", "poll")
+
+from config.settings import settings
+
+bind = settings.API_BIND
+workers = settings.API_WORKERS
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = settings.API_PRELOAD
+
+# preload 时模型必须在 master import api_server 时加载好才能被 fork 共享，不能放到后台
+if preload_app:
+    settings.API_BACKGROUND_LOAD = False
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+        server.log.info(f"Models preloaded, {gc.get_freeze_count()} objects frozen before fork")
+
+
+def post_fork(server, worker):
+    import torch
+
+    threads = settings.TORCH_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // max(workers, 1))
+    torch.set_num_threads(threads)
+
+    if preload_app:
+        import api_server
+        if api_server.rag is not None:
+            api_server.rag.after_fork()
+        api_server.answer_cache.reopen()
+        api_server.sessions.reopen()
+
+    server.log.info(f"Worker {worker.pid} ready (torch threads={threads})")
@@ -148,3 +148,26 @@ def split_text(text, max_length=500, overlap=50):
             start = 0
 
     return chunks
+
+
+def linearize_table(table):
+    """
+    表格 → 单段文本（供词法检索 / 文本 embedding 使用）
+    第一行是表头，之后每行为 "列名: 值 | 列名: 值"
+    """
+    if not table:
+        return ""
+
+    header = [str(h) for h in (table.get("header") or [])]
+    lines = [" | ".join(header)] if header else []
+
+    for row in table.get("rows") or []:
+        pairs = [
+            f"{h}: {v}"
+            for h, v in zip(header, row)
+            if v is not None and str(v).strip()
+        ]
+        if pairs:
+            lines.append(" | ".join(pairs))
+
+    return "\n".join(lines)
@@ -1,10 +1,16 @@
 # ingestion/indexer.py
 from ingestion.loader import scan_documents
 from ingestion.parser import parse_pdf
-from ingestion.chunker import chunk_blocks
+from ingestion.chunker import chunk_blocks, linearize_table
 from embedding.embedder import Embedder
 from storage.milvus_store import MilvusVectorStore
+from storage.blob_store import TableBlobStore
+from storage.token_store import PassageTokenStore
+from storage.index_version import bump_index_version
+from retrieval.bm25 import BM25Index
+from transformers import AutoTokenizer
 from config.settings import settings
+from pymilvus import utility
 from tqdm import tqdm
 
 # def build_index(source_dir="sourcepdf"):
@@ -64,10 +70,11 @@ from tqdm import tqdm
 #             print(f"❌ 文件处理失败: {doc['path']} ({e})")
 
 #     print(f"✅ 索引完成，共写入 {total_chunks} 个文本块。")
+import hashlib
+import os
+from pathlib import Path
+
 import numpy as np
-import zlib
-import json
-import base64
 
 def ensure_1d(vec, dim=None):
     if vec is None:
@@ -104,126 +111,382 @@ def ensure_1d(vec, dim=None):
 
 
 
-def compress_table_json(table_json: dict) -> str:
-    if not table_json:
-        return ""
-    raw = json.dumps(table_json).encode("utf-8")
-    zipped = zlib.compress(raw)
-    return base64.b64encode(zipped).decode("utf-8")
+def make_doc_id(path) -> str:
+    """
+    文档级 ID：相对 SOURCE_DIR 的 posix 路径（Windows 反斜杠也能对上）。
+    sourcepdf/x.pdf、./sourcepdf/x.pdf 和绝对路径都得到同一个 ID；
+    不在 SOURCE_DIR 下的文件用绝对路径
+    """
+    p = Path(path).resolve()
+    try:
+        return p.relative_to(Path(settings.SOURCE_DIR).resolve()).as_posix()
+    except ValueError:
+        return p.as_posix()
+
+
+def _legacy_doc_ids(doc_ids):
+    """
+    早期的 doc_id 是调用方传入的原始路径（如 sourcepdf/AIA/x.pdf），
+    返回 {规范化后的 doc_id: [旧 doc_id, ...]}，增量同步时据此迁移
+    """
+    legacy = {}
+    for doc_id in doc_ids:
+        norm = make_doc_id(doc_id)
+        if norm != doc_id and not Path(norm).is_absolute():
+            legacy.setdefault(norm, []).append(doc_id)
+    return legacy
+
+
+def file_hash(path) -> str:
+    """PDF 原文件的 sha256，用来判断文档是否有变化"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def pretokenize_passages(records, tokenizer, token_store):
+    """用 reranker 的 tokenizer 预分词文本块，查询时 Reranker 直接复用"""
+    texts = [r["text"] for r in records if r.get("text")]
+    if texts:
+        ids = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        token_store.put_many(texts, ids)
+
+
+def build_doc_records(doc, embedder, store, blob_store):
+    """
+    解析单个 PDF → chunk → embedding，返回该文档的全部 records
+    （每条 record 都带 doc_id / doc_hash，便于按文档删除和替换）
+    """
+    blocks = parse_pdf(doc["path"])
+    if not blocks:
+        print(f"⚠️ 无有效内容：{doc['path']}")
+        return []
+
+    doc_id = make_doc_id(doc["path"])
+    doc_hash = file_hash(doc["path"])
+
+    # 注入 metadata
+    for b in blocks:
+        b.setdefault("metadata", {})
+        b["metadata"].update({
+            "source": doc.get("path", ""),
+            "company": doc.get("company", ""),
+            "category": doc.get("category", ""),
+            "page_number": b["metadata"].get("page_number"),
+            "modality": b.get("modality"),
+        })
+
+    # chunk 化文本/表格
+    chunks = chunk_blocks(blocks, max_length=500, overlap=50)
+
+    # ------------------------------------------------------
+    # 为每个 chunk 构造 record
+    # ------------------------------------------------------
+    records = []
+    for c in chunks:
+        modality = c.get("modality")
+        meta = c.get("metadata", {})
+
+        text_value = None
+        #table_json = None
+        table_digest = None
+        text_vec = None
+        table_vec = None
+        table_text_vec = None
+
+        # 文本块
+        if modality == "text":
+            raw_text = (c.get("text") or "").strip()
+            if not raw_text:
+                continue
+
+            text_value = raw_text
+            # embed_text 返回 shape: (1,1024)
+            text_vec = embedder.embed_text([raw_text])[0]
+
+        # 表格块
+        elif modality == "table":
+            table = c.get("table")
+            if not table:
+                continue
+
+            header = table.get("header", [])
+            rows = table.get("rows", [])
+
+            # 表格 payload 写入外部 blob store，Milvus 只存 digest
+            table_digest = blob_store.put_table(table)
+            table_vec = embedder.embed_table(header, rows)
+
+            # 线性化表格的 bge-m3 向量：查询时可与文本通道共用一个 query 向量
+            if store.has_table_text:
+                table_text_vec = embedder.embed_text([linearize_table(table)])[0]
+
+        else:
+            continue
 
+        # 至少要有一个 vector
+        if text_vec is None and table_vec is None:
+            continue
 
-def build_index(source_dir="sourcepdf"):
+        # ----------- 关键：flatten vector -----------------
+        if text_vec is not None:
+            print("DEBUG TEXT_VEC:", text_vec, type(text_vec))
+            text_vec = ensure_1d(text_vec, store.text_dim)
+
+        if table_vec is not None:
+            table_vec = ensure_1d(table_vec, store.table_dim)
+
+        if table_text_vec is not None:
+            table_text_vec = ensure_1d(table_text_vec, store.text_dim)
+
+        records.append({
+            "modality": modality,
+            "text": text_value,
+            #"table_json": table_json,
+            "table_digest": table_digest,
+            "text_vec": text_vec,
+            "table_vec": table_vec,
+            "table_text_vec": table_text_vec,
+            "doc_id": doc_id,
+            "doc_hash": doc_hash,
+            "metadata": meta,
+        })
+
+    return records
+
+
+def build_index(source_dir=None, incremental=False, store=None, embedder=None):
+    """
+    incremental=True 时按文档增量更新：
+    - 内容 hash 未变的文档直接跳过
+    - 有变化的文档走 replace_source（先写新行再删旧行）
+
+    - 旧格式 doc_id（未规范化的路径）的文档整篇替换为规范化的 doc_id
+
+    source_dir 默认 SOURCE_DIR；store 默认是线上 alias，蓝绿重建时传入新版本 collection。
+    返回写入的块数。
+    """
 
     print("🚀 开始构建 IRAG_MM 多模态索引 ...")
 
-    docs = scan_documents(source_dir)
+    docs = scan_documents(source_dir or settings.SOURCE_DIR)
     if not docs:
         print("⚠️ 没有找到可索引的文件。")
-        return
+        return 0
 
-    embedder = Embedder()
-    store = MilvusVectorStore()
+    embedder = embedder or Embedder()
+    store = store or MilvusVectorStore()
+    blob_store = TableBlobStore()
+    token_store = PassageTokenStore()
+    rerank_tokenizer = AutoTokenizer.from_pretrained(settings.RERANKER_MODEL)
+
+    indexed = {}
+    legacy = {}
+    if incremental:
+        indexed = {s["doc_id"]: s["doc_hash"] for s in store.list_sources()}
+        legacy = _legacy_doc_ids(indexed)
 
     total = 0
+    skipped = 0
     batch_records = []
     batch_size = 100
 
 
     for doc in tqdm(docs, desc="索引进度"):
         try:
-            blocks = parse_pdf(doc["path"])
-            if not blocks:
-                print(f"⚠️ 无有效内容：{doc['path']}")
-                continue
+            doc_id = make_doc_id(doc["path"])
 
-            # 注入 metadata
-            for b in blocks:
-                b.setdefault("metadata", {})
-                b["metadata"].update({
-                    "source": doc.get("path", ""),
-                    "company": doc.get("company", ""),
-                    "category": doc.get("category", ""),
-                    "page_number": b["metadata"].get("page_number"),
-                    "modality": b.get("modality"),
-                })
-
-            # chunk 化文本/表格
-            chunks = chunk_blocks(blocks, max_length=500, overlap=50)
-
-            # ------------------------------------------------------
-            # 为每个 chunk 构造 record
-            # ------------------------------------------------------
-            for c in chunks:
-                modality = c.get("modality")
-                meta = c.get("metadata", {})
-
-                text_value = None
-                #table_json = None
-                table_blob = None
-                text_vec = None
-                table_vec = None
-
-                # 文本块
-                if modality == "text":
-                    raw_text = (c.get("text") or "").strip()
-                    if not raw_text:
-                        continue
-
-                    text_value = raw_text
-                    # embed_text 返回 shape: (1,1024)
-                    text_vec = embedder.embed_text([raw_text])[0]
-
-                # 表格块
-                elif modality == "table":
-                    table = c.get("table")
-                    if not table:
-                        continue
-
-                    header = table.get("header", [])
-                    rows = table.get("rows", [])
-
-                    table_json = table
-                    table_blob = compress_table_json(table_json)
-                    table_vec = embedder.embed_table(header, rows)
-
-                else:
+            old_ids = legacy.get(doc_id, [])
+            if incremental and (doc_id in indexed or old_ids):
+                if not old_ids and indexed[doc_id] == file_hash(doc["path"]):
+                    skipped += 1
                     continue
 
-                # 至少要有一个 vector
-                if text_vec is None and table_vec is None:
+                # 已存在但内容有变化 → 整篇替换（解析不出内容时保留旧行，同 reindex_document）
+                records = build_doc_records(doc, embedder, store, blob_store)
+                if not records:
+                    print(f"⚠️ 文档无有效内容，未做替换：{doc['path']}")
                     continue
+                pretokenize_passages(records, rerank_tokenizer, token_store)
+                store.replace_source(doc_id, records)
+                for old_id in old_ids:
+                    store.delete_source(old_id)
+                total += len(records)
+                continue
 
-                # ----------- 关键：flatten vector -----------------
-                if text_vec is not None:
-                    print("DEBUG TEXT_VEC:", text_vec, type(text_vec))
-                    text_vec = ensure_1d(text_vec, store.text_dim)
-
-                if table_vec is not None:
-                    table_vec = ensure_1d(table_vec, store.table_dim)
-
-                batch_records.append({
-                    "modality": modality,
-                    "text": text_value,
-                    #"table_json": table_json,
-                    "table_blob": table_blob,
-                    "text_vec": text_vec,
-                    "table_vec": table_vec,
-                    "metadata": meta,
-                })
-
+            records = build_doc_records(doc, embedder, store, blob_store)
+            pretokenize_passages(records, rerank_tokenizer, token_store)
+            batch_records.extend(records)
 
-                # 批量写入
-                if len(batch_records) >= batch_size:
-                    store.add_records(batch_records)
-                    total += len(batch_records)
-                    batch_records = []
+            # 批量写入
+            if len(batch_records) >= batch_size:
+                store.add_records(batch_records, bump=False)
+                total += len(batch_records)
+                batch_records = []
 
         except Exception as e:
             print(f"❌ 文件失败：{doc['path']} ({e})")
 
     # 剩余写入
     if batch_records:
-        store.add_records(batch_records)
+        store.add_records(batch_records, bump=False)
         total += len(batch_records)
 
+    if skipped:
+        print(f"⏭️ 跳过未变化的文档 {skipped} 个。")
     print(f"🎉 多模态索引构建完成，共写入 {total} 个块。")
+
+    # 批量写入不逐批 bump 索引版本，写完统一 bump 一次（build_bm25_index 内）；
+    # 蓝绿重建写的是未上线的新版本，BM25 与版本号都由 rebuild_index / promote 处理
+    if store.collection_name == settings.MILVUS_ALIAS:
+        build_bm25_index(store, blob_store)
+    elif total:
+        store.bump_if_live()
+    return total
+
+
+def build_bm25_index(store=None, blob_store=None, path=None, bump: bool = True):
+    """
+    从 Milvus 当前内容整体重建 BM25 倒排索引（文本块 + 线性化表格），
+    与 collection 保持一致；写入是原子替换，API 进程会自动重新加载。
+    bump=False：调用方随后自己 bump 索引版本（蓝绿重建由 promote 负责）
+    """
+    store = store or MilvusVectorStore()
+    blob_store = blob_store or TableBlobStore()
+    path = path or settings.BM25_INDEX_DIR
+
+    docs = []
+    for row in store.iter_rows(["id", "text", "table_digest", "modality", "doc_id", "metadata"]):
+        if row.get("modality") == "table":
+            index_text = linearize_table(blob_store.get_table(row.get("table_digest")))
+        else:
+            index_text = row.get("text") or ""
+        if not index_text:
+            continue
+
+        docs.append({
+            "index_text": index_text,
+            "id": row["id"],
+            "text": row.get("text"),
+            "table_digest": row.get("table_digest"),
+            "modality": row.get("modality"),
+            "doc_id": row.get("doc_id"),
+            "metadata": row.get("metadata") or {},
+        })
+
+    index = BM25Index.build(docs)
+    index.save(path)
+
+    # Milvus 写入时已 bump 过版本号，但在 BM25 重建完成之前的查询仍用旧索引
+    # （可能含已删除行），其结果被缓存在新版本号下；这里再 bump 一次让它们失效
+    if bump and os.path.abspath(path) == os.path.abspath(settings.BM25_INDEX_DIR):
+        bump_index_version()
+
+    print(f"🔤 BM25 索引已更新：{len(docs)} 个块，{len(index.vocab)} 个词项 → {path}")
+    return index
+
+
+def validate_build(store, embedder, live_rows=0, smoke_queries=None, min_row_ratio=None):
+    """
+    新版本 collection 上线前的校验：
+    - 行数不能为 0，且不低于线上版本的 min_row_ratio
+    - 每条 smoke query 在文本通道都要有命中
+    返回错误列表（空列表表示通过）
+    """
+    min_row_ratio = settings.REBUILD_MIN_ROW_RATIO if min_row_ratio is None else min_row_ratio
+    smoke_queries = settings.REBUILD_SMOKE_QUERIES if smoke_queries is None else smoke_queries
+
+    errors = []
+    rows = store.collection.num_entities
+    if rows == 0:
+        errors.append("new collection is empty")
+    elif live_rows and rows < live_rows * min_row_ratio:
+        errors.append(f"row count {rows} < {min_row_ratio:.0%} of live {live_rows}")
+
+    if smoke_queries:
+        vectors = embedder.embed_text(smoke_queries)
+        for q, vec in zip(smoke_queries, vectors):
+            if not store.search_text(ensure_1d(vec, store.text_dim).tolist(), top_k=3):
+                errors.append(f"smoke query returned no hits: {q}")
+
+    return errors
+
+
+def rebuild_index(source_dir=None, retain=None, drop_legacy=False):
+    """
+    蓝绿重建：
+    1. 写入全新的版本化 collection（线上 alias 不受影响）
+    2. 校验行数 + smoke query
+    3. 原子切换 alias
+    4. 按保留策略清理旧版本
+    """
+    embedder = Embedder()
+
+    live = MilvusVectorStore.resolve_alias()
+    live_rows = 0
+    if live:
+        live_rows = MilvusVectorStore(collection_name=live).collection.num_entities
+    elif utility.has_collection(settings.MILVUS_ALIAS):
+        live_rows = MilvusVectorStore().collection.num_entities
+
+    store = MilvusVectorStore.create_version()
+    print(f"🟢 新版本 collection：{store.collection_name}（线上：{live or settings.MILVUS_ALIAS}）")
+
+    build_index(source_dir, store=store, embedder=embedder)
+
+    errors = validate_build(store, embedder, live_rows=live_rows)
+    if errors:
+        print(f"❌ 新版本校验失败，已丢弃 {store.collection_name}：")
+        for e in errors:
+            print(f"   - {e}")
+        store.drop()
+        return None
+
+    # 先换 BM25 再切 alias：中间片刻缓存的结果仍在旧版本号下，随 promote 的 bump 一起失效；
+    # 整个蓝绿重建只在 promote 里 bump 一次
+    build_bm25_index(store, bump=False)
+    store.promote(drop_legacy=drop_legacy)
+    MilvusVectorStore.gc_versions(retain=retain)
+    print(f"🎉 蓝绿切换完成：{settings.MILVUS_ALIAS} → {store.collection_name}")
+    return store.collection_name
+
+
+def reindex_document(path):
+    """
+    单个 PDF 修订后：只替换该文档的行，无需整库重建。
+    该文档尚未索引（路径写错时也是如此）时抛 ValueError，不会新增一份重复的行
+    """
+    doc_id = make_doc_id(path)
+    store = MilvusVectorStore()
+    if not store.has_source(doc_id):
+        raise ValueError(f"No indexed rows for {doc_id}")
+
+    p = Path(path)
+    parts = p.parts
+    doc = {
+        "path": str(p),
+        "company": parts[-3] if len(parts) >= 3 else "unknown",
+        "policy_type": parts[-2] if len(parts) >= 2 else "unknown",
+        "file_name": p.name,
+    }
+
+    embedder = Embedder()
+    blob_store = TableBlobStore()
+
+    records = build_doc_records(doc, embedder, store, blob_store)
+    if not records:
+        print(f"⚠️ 文档无有效内容，未做替换：{path}")
+        return 0
+
+    pretokenize_passages(
+        records,
+        AutoTokenizer.from_pretrained(settings.RERANKER_MODEL),
+        PassageTokenStore(),
+    )
+
+    store.replace_source(doc_id, records)
+    build_bm25_index(store, blob_store)
+    print(f"🔁 已替换文档 {path}，共 {len(records)} 个块。")
+    return len(records)
@@ -0,0 +1,201 @@
+"""
+进程内 BM25 词法检索通道
+
+- 分词：英文/数字按词（保留 "lppm 774-2211c" 这类产品编号整体，同时拆出子词），
+  中日韩文字取单字 + 二元组，无需额外分词词典
+- 倒排表：按词项连续存放 doc 序号（uint32）与词频（uint16），
+  offsets 记录每个词项的起止位置，整体存为一个 .npz
+- 文档 payload（id / text / table_digest / metadata）存为 docs.jsonl，
+  检索结果与 Milvus hit 同构（{"id", "distance", "entity"}），可直接参与 RAG-Fusion
+
+由 indexer 在写入 Milvus 后整体重建（见 ingestion.indexer.build_bm25_index）。
+"""
+
+import json
+import math
+import os
+import re
+import shutil
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+TOKEN_RE = re.compile(
+    r"[a-z0-9]+(?:[-./][a-z0-9]+)*"
+    # 假名 / CJK 扩展 A / CJK 基本区 / 谚文 / CJK 兼容区
+    "|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+"
+)
+SPLIT_RE = re.compile(r"[-./]")
+
+
+def tokenize(text):
+    if not text:
+        return []
+
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for m in TOKEN_RE.finditer(text):
+        tok = m.group()
+        if tok[0].isascii():
+            tokens.append(tok)
+            # 产品编号 / 条款号：整体 + 各段都可以命中
+            if SPLIT_RE.search(tok):
+                tokens.extend(p for p in SPLIT_RE.split(tok) if p)
+        else:
+            tokens.extend(tok)
+            tokens.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+    return tokens
+
+
+class BM25Index:
+
+    def __init__(self, vocab, offsets, doc_ids, tfs, doc_len, docs, k1=1.5, b=0.75):
+        self.vocab = vocab                  # term → 序号
+        self.offsets = offsets              # int64[V + 1]
+        self.doc_ids = doc_ids              # uint32[P]
+        self.tfs = tfs                      # uint16[P]
+        self.doc_len = doc_len              # uint32[N]
+        self.docs = docs                    # payload 列表
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(cls, docs, k1=1.5, b=0.75):
+        """
+        docs: [{"index_text": str, "id": ..., "text": ..., "table_digest": ...,
+                "modality": ..., "metadata": {...}}, ...]
+        """
+        postings = {}
+        doc_len = np.zeros(len(docs), dtype="uint32")
+        payloads = []
+
+        for i, d in enumerate(docs):
+            counts = Counter(tokenize(d.get("index_text")))
+            doc_len[i] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((i, min(tf, 65535)))
+            payloads.append({k: v for k, v in d.items() if k != "index_text"})
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        for t_idx, term in enumerate(terms):
+            offsets[t_idx + 1] = offsets[t_idx] + len(postings[term])
+
+        doc_ids = np.empty(offsets[-1], dtype="uint32")
+        tfs = np.empty(offsets[-1], dtype="uint16")
+        for t_idx, term in enumerate(terms):
+            lo, hi = offsets[t_idx], offsets[t_idx + 1]
+            plist = postings[term]
+            doc_ids[lo:hi] = [p[0] for p in plist]
+            tfs[lo:hi] = [p[1] for p in plist]
+
+        vocab = {t: i for i, t in enumerate(terms)}
+        return cls(vocab, offsets, doc_ids, tfs, doc_len, payloads, k1=k1, b=b)
+
+    # ------------------------------------------------------------------
+    # 持久化：先写临时目录再整体替换，读者不会读到半个索引
+    # ------------------------------------------------------------------
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        np.savez(
+            os.path.join(tmp, "postings.npz"),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            doc_len=self.doc_len,
+        )
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(tmp, "docs.jsonl"), "w", encoding="utf-8") as f:
+            for d in self.docs:
+                f.write(json.dumps(d, ensure_ascii=False) + "\n")
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": len(self.docs), "terms": len(terms)}, f)
+
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            terms = json.load(f)
+        with open(os.path.join(path, "docs.jsonl"), encoding="utf-8") as f:
+            docs = [json.loads(line) for line in f if line.strip()]
+
+        arrays = np.load(os.path.join(path, "postings.npz"))
+        return cls(
+            {t: i for i, t in enumerate(terms)},
+            arrays["offsets"],
+            arrays["doc_ids"],
+            arrays["tfs"],
+            arrays["doc_len"],
+            docs,
+            k1=meta.get("k1", 1.5),
+            b=meta.get("b", 0.75),
+        )
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+    def search(self, query, top_k=5, filters=None):
+        """返回与 MilvusClient 同构的 hit 列表：[{"id", "distance", "entity"}, ...]"""
+        n = len(self.docs)
+        if n == 0:
+            return []
+
+        scores = np.zeros(n, dtype="float32")
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(self.avgdl, 1e-9))
+
+        for term in set(tokenize(query)):
+            t_idx = self.vocab.get(term)
+            if t_idx is None:
+                continue
+            lo, hi = self.offsets[t_idx], self.offsets[t_idx + 1]
+            ids = self.doc_ids[lo:hi]
+            tf = self.tfs[lo:hi].astype("float32")
+
+            df = hi - lo
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm[ids])
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) == 0:
+            return []
+        order = candidates[np.argsort(-scores[candidates])]
+
+        hits = []
+        for i in order:
+            doc = self.docs[i]
+            if filters and not self._match(doc, filters):
+                continue
+            hits.append({"id": doc.get("id"), "distance": float(scores[i]), "entity": doc})
+            if len(hits) >= top_k:
+                break
+        return hits
+
+    @staticmethod
+    def _match(doc, filters):
+        meta = doc.get("metadata") or {}
+        for k, v in filters.items():
+            value = doc.get(k) if k in ("doc_id", "modality") else meta.get(k)
+            if isinstance(v, (list, tuple, set)):
+                if value not in v:
+                    return False
+            elif value != v:
+                return False
+        return True
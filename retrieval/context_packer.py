@@ -0,0 +1,153 @@
+"""
+按 token 预算拼接检索上下文
+
+- 同一 source + 页码的文本块合并成一段，去掉 split_text 留下的重叠词
+  （相邻 chunk 之间默认重复 50 个词），被其他块完整包含的块直接丢弃
+- 表格按 "表头一行 + 每行一行" 的紧凑形式渲染，不再整表丢弃
+- 按检索得分（score 越小越相关）依次放入，直到用完 token 预算；
+  第一段放不下时截断放入，保证上下文不为空
+
+token 数用启发式估计（CJK 字符 1 个 token，其余约 4 个字符 1 个 token），
+与 LLM 实际 tokenizer 有出入，预算请留出余量；也可以传入自定义 count_tokens。
+"""
+
+import re
+
+CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+# 相邻 chunk 的重叠至少这么多个词才合并，避免偶然相同的词被误判为重叠
+MIN_OVERLAP_WORDS = 5
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    rest = len(re.sub(r"\s+", "", CJK_RE.sub("", text)))
+    return cjk + (rest + 3) // 4
+
+
+def render_table(table):
+    """表格 → 紧凑文本：表头一行，之后每行按列用 " | " 连接"""
+    if not table:
+        return ""
+
+    def _cell(v):
+        return re.sub(r"\s+", " ", str(v)).strip() if v is not None else ""
+
+    lines = []
+    header = [_cell(h) for h in (table.get("header") or [])]
+    if any(header):
+        lines.append(" | ".join(header))
+
+    for row in table.get("rows") or []:
+        cells = [_cell(v) for v in row]
+        if any(cells):
+            lines.append(" | ".join(cells))
+
+    return "\n".join(lines)
+
+
+def _overlap(a, b):
+    """a 的后缀与 b 的前缀重合的词数（取最长）"""
+    if not a or not b:
+        return 0
+    limit = min(len(a), len(b))
+    for i in range(len(a) - limit, len(a)):
+        if a[i] == b[0] and a[i:] == b[:len(a) - i]:
+            return len(a) - i
+    return 0
+
+
+def _merge_texts(texts):
+    """
+    同一页的多个文本块 → 去重合并后的段落列表
+    能首尾相接的块拼成一段，其余各自成段（保持传入顺序）
+    """
+    pieces = []
+    for t in texts:
+        words = t.split()
+        if not words:
+            continue
+        joined = " ".join(words)
+        if any(joined in " ".join(p) for p in pieces):
+            continue
+        # 新块包含已有块时，替换掉被包含的块
+        pieces = [p for p in pieces if " ".join(p) not in joined]
+        pieces.append(words)
+
+    merged = True
+    while merged and len(pieces) > 1:
+        merged = False
+        for i in range(len(pieces)):
+            for j in range(len(pieces)):
+                if i == j:
+                    continue
+                k = _overlap(pieces[i], pieces[j])
+                if k >= min(MIN_OVERLAP_WORDS, len(pieces[j])):
+                    pieces[i] = pieces[i] + pieces[j][k:]
+                    del pieces[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return [" ".join(p) for p in pieces]
+
+
+def _truncate(text, max_tokens, count_tokens):
+    """二分截断到 max_tokens 以内（按字符）"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip()
+
+
+def pack_context(results, max_tokens=None, count_tokens=None):
+    """
+    输入:
+        results:    RAGInterface.retrieve 的输出（已按 score 升序）
+        max_tokens: token 预算，None / 0 表示不限制
+    输出:
+        List[str]，每个元素是一段参考资料，按相关性排序
+    """
+    count_tokens = count_tokens or estimate_tokens
+
+    # 1) 按 (source, page) 分组，组的先后由组内最相关的块决定
+    groups = {}
+    for r in sorted(results, key=lambda x: x.get("score", 0.0)):
+        meta = r.get("metadata") or {}
+        key = (meta.get("source"), meta.get("page_number"))
+        group = groups.setdefault(key, {"texts": [], "tables": []})
+        if r.get("table"):
+            group["tables"].append(r["table"])
+        elif r.get("text"):
+            group["texts"].append(r["text"])
+
+    blocks = []
+    for group in groups.values():
+        blocks.extend(_merge_texts(group["texts"]))
+        for table in group["tables"]:
+            rendered = render_table(table)
+            if rendered and rendered not in blocks:
+                blocks.append(rendered)
+
+    if not max_tokens:
+        return blocks
+
+    # 2) 按相关性依次放入，放不下的跳过（后面更短的块仍有机会）
+    packed, used = [], 0
+    for block in blocks:
+        cost = count_tokens(block)
+        if used + cost <= max_tokens:
+            packed.append(block)
+            used += cost
+        elif not packed:
+            packed.append(_truncate(block, max_tokens, count_tokens))
+            used = max_tokens
+
+    return packed
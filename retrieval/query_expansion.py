@@ -0,0 +1,206 @@
+"""
+多 query 扩展（RAG-Fusion 的 query 侧）
+
+口语化的问题（"出意外住院能赔多少钱"）和条款用语（"意外伤害住院医疗保险金"）差距大，
+只靠一个 query 召回不全。这里把原问题改写成几个不同说法，由 RAGInterface
+一次 batch embedding、一次多向量搜索，再把各改写的排名一起做 reciprocal rank 融合。
+
+mode：
+    off    —— 不扩展
+    rules  —— 模板规则：口语 → 条款用语的同义替换、问句短语 → 陈述短语、去掉疑问词 / 语气词只留关键词
+    llm    —— 调用 LLM 改写（结果按问题缓存）；失败或超时退回 rules
+
+expand() 返回的第一个元素总是原 query。
+"""
+
+import re
+
+from config.settings import settings
+from retrieval.cache import LRUCache
+
+# 口语 → 保险条款常用说法（按最长匹配一次性替换，替换结果不会被再次替换）
+SYNONYMS = {
+    "出意外": "意外伤害",
+    "意外": "意外伤害",
+    "看病": "医疗",
+    "生病": "疾病",
+    "住院": "住院医疗",
+    "死了": "身故",
+    "去世": "身故",
+    "残废": "伤残",
+    "残疾": "伤残",
+    "报销": "理赔",
+    "赔多少钱": "赔付金额",
+    "赔多少": "赔付金额",
+    "赔钱": "赔付",
+    "不赔": "责任免除",
+    "不保": "责任免除",
+    "保多少": "保险金额",
+    "交钱": "缴纳保险费",
+    "保费": "保险费",
+    "退保": "解除合同",
+    "买保险": "投保",
+}
+
+# 问句短语 → 陈述短语：疑问词连同它问的内容整体替换，
+# 不单独替换 "多久" / "几岁" 这类疑问词（"理赔需要多久" 不会变成 "理赔需要期限"）
+QUESTION_PHRASES = {
+    "如何申请": "申请流程",
+    "怎么申请": "申请流程",
+    "如何理赔": "理赔流程",
+    "怎么理赔": "理赔流程",
+    "怎么赔": "理赔流程",
+    "如何投保": "投保流程",
+    "怎么投保": "投保流程",
+    "如何退保": "解除合同流程",
+    "怎么退保": "解除合同流程",
+    "需要多久": "所需时间",
+    "要多久": "所需时间",
+    "多久到账": "理赔时效",
+    "多久能赔": "理赔时效",
+    "等多久": "等待期",
+    "保多久": "保险期间",
+    "交多久": "缴费期间",
+    "几岁能买": "投保年龄",
+    "几岁可以买": "投保年龄",
+    "几岁能投保": "投保年龄",
+    "几岁可以投保": "投保年龄",
+}
+SYNONYMS.update(QUESTION_PHRASES)
+
+# 已经是条款用语的词原样保留：它们比口语词长，最长匹配时先命中，
+# 避免 "意外伤害" → "意外伤害伤害"、"意外医疗" → "意外伤害医疗" 这类改写
+FORMAL_TERMS = (
+    "意外伤害", "意外医疗", "住院医疗", "医疗保险", "理赔", "投保", "投保年龄", "等待期",
+    "保险费", "保险金额", "责任免除", "身故", "伤残", "疾病",
+)
+SYNONYMS.update({t: t for t in FORMAL_TERMS if t not in SYNONYMS})
+
+_SYNONYM_RE = re.compile("|".join(sorted(map(re.escape, SYNONYMS), key=len, reverse=True)))
+
+# 语气词 / 提问套话 / 疑问词，去掉后只剩关键词
+FILLER_RE = re.compile(
+    r"请问|我想知道|我想问|想了解|麻烦|能不能|可不可以|可以吗|是什么|是多少|有哪些|有什么|怎么样|"
+    r"如何|怎样|怎么|为什么|是否|能否|多久|哪些|哪个|什么|"
+    r"一下|吗|呢|啊|呀|吧|"
+    r"\b(?:what|which|how|is|are|the|a|an|do|does|can|i|my|please|tell|me|about)\b",
+    re.IGNORECASE,
+)
+PUNCT_RE = re.compile(r"[?？!！,，。.、;；:：\"'“”‘’()（）\s]+")
+
+# LLM 输出的行首编号 / 项目符号
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)、]|[（(]\d+[)）])\s*")
+
+LLM_PROMPT = (
+    "把下面的保险问题改写成 {n} 个不同说法的检索查询，尽量使用保险条款中的正式用语，"
+    "保持原意，不要回答问题。每行一个，不要编号，不要输出其他内容。\n问题：{query}"
+)
+
+
+class QueryExpander:
+
+    MODES = ("off", "rules", "llm")
+
+    def __init__(self, mode: str = None, max_variants: int = None, llm_client=None):
+        """
+        max_variants：除原 query 外最多几个改写
+        llm_client：llm 模式使用的 serving.llm_client.LLMClient（默认按需新建）
+        """
+        self.mode = (mode or settings.QUERY_EXPANSION or "off").lower()
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown QUERY_EXPANSION: {self.mode}. Available: {', '.join(self.MODES)}")
+        self.max_variants = settings.QUERY_EXPANSION_MAX if max_variants is None else max_variants
+        self._llm = llm_client
+        self._sync_llm = None
+        self._llm_cache = LRUCache(maxsize=1024)
+
+    @property
+    def enabled(self):
+        return self.mode != "off" and self.max_variants > 0
+
+    # ------------------------------------------------------------------
+    # 规则改写
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _keywords(text):
+        return PUNCT_RE.sub(" ", FILLER_RE.sub(" ", text)).strip()
+
+    def rule_variants(self, query):
+        rewritten = _SYNONYM_RE.sub(lambda m: SYNONYMS[m.group(0)], query)
+        return [rewritten, self._keywords(rewritten), self._keywords(query)]
+
+    # ------------------------------------------------------------------
+    # LLM 改写
+    # ------------------------------------------------------------------
+    def _get_llm(self, sync=False):
+        # chat_sync 每次用独立 event loop 并在结束时关闭连接池，不能与 event loop 内的实例共用
+        from serving.llm_client import LLMClient
+        if sync:
+            if self._sync_llm is None:
+                self._sync_llm = LLMClient()
+            return self._sync_llm
+        if self._llm is None:
+            self._llm = LLMClient()
+        return self._llm
+
+    def _llm_messages(self, query):
+        return [{"role": "user", "content": LLM_PROMPT.format(n=self.max_variants, query=query)}]
+
+    @staticmethod
+    def _parse_llm(text):
+        lines = (BULLET_RE.sub("", line).strip() for line in (text or "").splitlines())
+        return [line for line in lines if line]
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+    def _finish(self, query, variants):
+        """原 query 在前，去重（忽略空白 / 标点差异），截到 max_variants 个改写"""
+        seen = {PUNCT_RE.sub("", query).lower()}
+        out = [query]
+        for v in variants:
+            key = PUNCT_RE.sub("", v).lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            out.append(v)
+            if len(out) > self.max_variants:
+                break
+        return out
+
+    def expand(self, query):
+        if not self.enabled or not query:
+            return [query]
+        if self.mode == "llm":
+            cached = self._llm_cache.get(query)
+            if cached is not None:
+                return cached
+            try:
+                text = self._get_llm(sync=True).chat_sync(
+                    self._llm_messages(query), deadline=settings.QUERY_EXPANSION_LLM_TIMEOUT
+                )
+                out = self._finish(query, self._parse_llm(text))
+                self._llm_cache.set(query, out)
+                return out
+            except Exception as e:
+                print(f"⚠️ LLM 查询改写失败，改用规则改写: {e}")
+        return self._finish(query, self.rule_variants(query))
+
+    async def aexpand(self, query):
+        """expand 的协程版本（llm 模式不阻塞 event loop）"""
+        if not self.enabled or not query:
+            return [query]
+        if self.mode == "llm":
+            cached = self._llm_cache.get(query)
+            if cached is not None:
+                return cached
+            try:
+                text = await self._get_llm().chat(
+                    self._llm_messages(query), deadline=settings.QUERY_EXPANSION_LLM_TIMEOUT
+                )
+                out = self._finish(query, self._parse_llm(text))
+                self._llm_cache.set(query, out)
+                return out
+            except Exception as e:
+                print(f"⚠️ LLM 查询改写失败，改用规则改写: {e}")
+        return self._finish(query, self.rule_variants(query))
@@ -1,42 +1,172 @@
+import hashlib
+
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
+from config.settings import settings
+from retrieval.cache import LRUCache
+from storage.token_store import PassageTokenStore
+
 
 class Reranker:
     """
     bge-reranker-base 实现 re-ranking
     输入：query(str) + candidate_texts(list[str])
     输出：对应相似度得分（越高越相关）
+
+    性能相关：
+    - (query-hash, chunk-id) → score 的有界 LRU 缓存，热门 passage 不重复打分
+    - passage token ids 优先取索引时预分词的结果（PassageTokenStore）
+    - 按拼接后长度排序再切 sub-batch，减少 padding
     """
 
-    def __init__(self, model_name="BAAI/bge-reranker-base"):
+    def __init__(self, model_name=None, batch_size=None, cache_size=None, token_store=None):
+        model_name = model_name or settings.RERANKER_MODEL
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        
+
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
         self.model.to(self.device)
         self.model.eval()
 
-    def rerank(self, query, texts):
+        self.max_length = 512
+        self.max_query_length = 128
+        self.batch_size = batch_size or settings.RERANK_BATCH_SIZE
+
+        self.score_cache = LRUCache(maxsize=cache_size or settings.RERANK_CACHE_SIZE)
+        # 查询期现分词的 passage 也缓存一份，避免重复分词
+        self.passage_cache = LRUCache(maxsize=cache_size or settings.RERANK_CACHE_SIZE)
+        self.token_store = token_store or PassageTokenStore(model_name)
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _passage_ids(self, texts):
+        """passage → token ids：内存缓存 → 预分词存储 → 现场分词"""
+        result = {}
+        missing = []
+        for t in texts:
+            ids = self.passage_cache.get(t)
+            if ids is None:
+                missing.append(t)
+            else:
+                result[t] = ids
+
+        if missing:
+            stored = self.token_store.get_many(missing)
+            fresh = [t for t in missing if t not in stored]
+            if fresh:
+                encoded = self.tokenizer(fresh, add_special_tokens=False)["input_ids"]
+                stored.update(zip(fresh, encoded))
+            for t, ids in stored.items():
+                self.passage_cache.set(t, ids)
+            result.update(stored)
+
+        return result
+
+    def _build_inputs(self, query, texts, passages):
+        """(query, text) → 拼好特殊符号的 input ids，passage 按剩余长度截断"""
+        q_ids = self.tokenizer(
+            query,
+            add_special_tokens=False,
+            truncation=True,
+            max_length=self.max_query_length,
+        )["input_ids"]
+
+        budget = self.max_length - len(q_ids) - self.tokenizer.num_special_tokens_to_add(pair=True)
+        return [
+            self.tokenizer.build_inputs_with_special_tokens(q_ids, passages[t][:budget])
+            for t in texts
+        ]
+
+    def _score(self, query, texts):
+        """对 (query, text) 打分，不经过 score 缓存"""
+        return self._run(self._build_inputs(query, texts, self._passage_ids(texts)))
+
+    def _run(self, inputs):
+        """模型前向；inputs 可以来自不同 query"""
+        # 按长度排序后切 sub-batch，同一批长度接近，padding 最少
+        order = sorted(range(len(inputs)), key=lambda i: len(inputs[i]))
+        scores = [0.0] * len(inputs)
+
+        for start in range(0, len(order), self.batch_size):
+            part = order[start:start + self.batch_size]
+            batch = self.tokenizer.pad(
+                {"input_ids": [inputs[i] for i in part]},
+                return_tensors="pt",
+            ).to(self.device)
+
+            with torch.no_grad():
+                logits = self.model(**batch).logits.view(-1)
+
+            for i, s in zip(part, logits.float().cpu().tolist()):
+                scores[i] = s
+
+        return scores
+
+    def _keys(self, query, texts, ids):
+        q_hash = self._hash(query)
+        return [
+            (q_hash, ids[i] if ids is not None and ids[i] is not None else self._hash(t))
+            for i, t in enumerate(texts)
+        ]
+
+    def rerank(self, query, texts, ids=None):
         """
         输入:
             query: str
             texts: List[str]
+            ids:   List，可选，与 texts 对应的 chunk id（用于 score 缓存）；
+                   不传时以文本 hash 作为 id
         输出:
             List[float] 对应每个文本的相关性分数
         """
+        if not texts:
+            return []
 
-        pairs = [[query, t] for t in texts]
+        keys = self._keys(query, texts, ids)
+        scores = [self.score_cache.get(k) for k in keys]
+        todo = [i for i, s in enumerate(scores) if s is None]
 
-        inputs = self.tokenizer(
-            pairs,
-            padding=True,
-            truncation=True,
-            max_length=512,
-            return_tensors="pt"
-        ).to(self.device)
+        if todo:
+            fresh = self._score(query, [texts[i] for i in todo])
+            for i, s in zip(todo, fresh):
+                scores[i] = s
+                self.score_cache.set(keys[i], s)
+
+        return scores
+
+    def rerank_batch(self, queries, texts_list, ids_list=None):
+        """
+        多个 query 的候选一起打分：所有 (query, text) 对混在一起按长度切 sub-batch，
+        GPU 利用率比逐个 query 调 rerank 高得多
+        输出: List[List[float]]，与 texts_list 一一对应
+        """
+        ids_list = ids_list or [None] * len(queries)
+        all_scores, todo = [], []
+
+        for qi, (query, texts, ids) in enumerate(zip(queries, texts_list, ids_list)):
+            keys = self._keys(query, texts, ids)
+            scores = [self.score_cache.get(k) for k in keys]
+            all_scores.append(scores)
+            todo.extend((qi, i, keys[i]) for i, s in enumerate(scores) if s is None)
+
+        if todo:
+            passages = self._passage_ids(list({texts_list[qi][i] for qi, i, _ in todo}))
+            by_query = {}
+            for qi, i, _ in todo:
+                by_query.setdefault(qi, []).append(i)
+
+            # todo 本身按 qi、i 递增，与这里拼出的 inputs 顺序一致
+            inputs = []
+            for qi, idx in by_query.items():
+                inputs.extend(self._build_inputs(
+                    queries[qi], [texts_list[qi][i] for i in idx], passages
+                ))
 
-        with torch.no_grad():
-            scores = self.model(**inputs).logits.squeeze(-1)
+            for (qi, i, key), s in zip(todo, self._run(inputs)):
+                all_scores[qi][i] = s
+                self.score_cache.set(key, s)
 
-        return scores.cpu().tolist()
+        return all_scores
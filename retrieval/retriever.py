@@ -101,185 +101,837 @@
 - Cross-Encoder Re-ranking：BAAI/bge-reranker-base
 """
 
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from config.settings import settings
 from embedding.embedder import Embedder
 from storage.milvus_store import MilvusVectorStore
+from storage.blob_store import TableBlobStore
+from storage.index_version import read_index_version
+from retrieval.bm25 import BM25Index
+from retrieval.cache import LRUCache
+from retrieval.context_packer import pack_context
+from retrieval.query_expansion import QueryExpander
 from retrieval.reranker import Reranker
-import zlib
-import json
-import base64
+
+
+def _hit_entity(hit):
+    """同时兼容 ORM 的 Hit（hit.entity）和 MilvusClient 的 dict hit"""
+    ent = getattr(hit, "entity", None)
+    if ent is None and isinstance(hit, Mapping):
+        ent = hit.get("entity") or {}
+    return ent
+
+
+def _hit_id(hit):
+    """Milvus 主键（chunk id）"""
+    if isinstance(hit, Mapping) and "id" in hit:
+        return hit["id"]
+    return getattr(hit, "id", None)
+
 
 class RAGInterface:
     def __init__(
         self,
         w_text: float = 1.0,     # 文本检索权重
         w_table: float = 1.0,    # 表格检索权重
+        w_bm25: float = None,    # BM25 词法检索权重（默认 settings.BM25_WEIGHT，0 关闭）
         gamma: float = 0.7,      # reranker 在最终融合中的权重
         candidate_multiplier: int = 3,   # 先取多少候选再精排
+        text_timeout: float = None,      # 文本通道超时（秒）
+        table_timeout: float = None,     # 表格通道超时（秒）
     ):
         print("🔗 初始化多模态 RAG 接口组件...")
         self.embedder = Embedder()
         self.store = MilvusVectorStore()
+        self.blob_store = TableBlobStore()
         self.reranker = Reranker()
 
         self.w_text = w_text
         self.w_table = w_table
+        self.w_bm25 = settings.BM25_WEIGHT if w_bm25 is None else w_bm25
         self.gamma = gamma
         self.candidate_multiplier = candidate_multiplier
-    
-
+        self.table_mode = self._resolve_table_mode(settings.TABLE_QUERY_MODE)
+        if self.table_mode == "tapas":
+            # 查询时要用 TAPAS：在构造时加载（只加载权重，不做推理），
+            # gunicorn preload 下由 master 加载一份，worker 通过 fork 共享
+            self.embedder.load_table_model()
+
+        # collection 的 schema / 索引类型随 promote 变化，索引版本变了就重新读取
+        self._index_version = read_index_version()
+        self._index_lock = threading.Lock()
+        self.text_timeout = settings.TEXT_CHANNEL_TIMEOUT if text_timeout is None else text_timeout
+        self.table_timeout = settings.TABLE_CHANNEL_TIMEOUT if table_timeout is None else table_timeout
+
+        # 文本 / 表格两路在 fusion 之前互不依赖，放到线程池里并发执行
+        self._channel_pool = ThreadPoolExecutor(
+            max_workers=settings.RETRIEVE_WORKERS,
+            thread_name_prefix="rag-channel",
+        )
+
+        # aretrieve 的模型推理（embedding / rerank）走有界线程池，不阻塞 event loop
+        self._infer_pool = ThreadPoolExecutor(
+            max_workers=settings.INFERENCE_WORKERS,
+            thread_name_prefix="rag-infer",
+        )
+
+        # 每个候选的 rerank 耗时估计（毫秒），用于延迟预算
+        self._rerank_ms_per_item = settings.RERANK_MS_PER_ITEM
+        self._cost_lock = threading.Lock()
+
+        # 可选的多 query 扩展（QUERY_EXPANSION=rules / llm）
+        self.expander = QueryExpander()
+
+        self.result_cache = LRUCache(
+            maxsize=settings.RESULT_CACHE_SIZE,
+            ttl=settings.RESULT_CACHE_TTL or None,
+        )
+
+        # BM25 索引按需加载，索引目录被 indexer 替换后自动重新加载
+        self._bm25_index = None
+        self._bm25_mtime = None
+        self._bm25_lock = threading.Lock()
+
+
+    def after_fork(self):
+        """
+        多 worker 部署（gunicorn preload_app）时在每个 worker 里调用：
+        模型权重随 fork 共享，Milvus / SQLite 连接则在子进程中重建
+        """
+        self.store.reconnect()
+        self.blob_store.reopen()
+        self.reranker.token_store.reopen()
+
+    def _sync_index_version(self):
+        """索引版本变化（promote / 增量更新）后刷新 collection 信息和 table_mode"""
+        version = read_index_version()
+        if version == self._index_version:
+            return
+        with self._index_lock:
+            if version == self._index_version:
+                return
+            self.store.refresh()
+            table_mode = self._resolve_table_mode(settings.TABLE_QUERY_MODE)
+            if table_mode == "tapas":
+                self.embedder.load_table_model()
+            self.table_mode = table_mode
+            self._index_version = version
+
+    def _resolve_table_mode(self, mode):
+        """tapas | text；collection 缺少 table_text_vector 时退回 tapas"""
+        mode = (mode or "tapas").lower()
+        if mode not in ("tapas", "text"):
+            raise ValueError(f"Unknown TABLE_QUERY_MODE: {mode}. Available: tapas, text")
+        if mode == "text" and not self.store.has_table_text:
+            print("⚠️ 当前 collection 没有 table_text_vector（需蓝绿重建），表格通道仍使用 TAPAS")
+            return "tapas"
+        return mode
 
 
     # ------------------------------------------------------
-    # 核心接口
+    # 单路检索：embedding + 向量搜索
+    # q_vec：已算好的 bge-m3 query 向量（text 模式下两路共用）
     # ------------------------------------------------------
-    def retrieve(self, query: str, top_k: int = 5, filters: dict = None):
-
-        def decompress_table_blob(blob: str) -> dict:
-            if not blob:
-                return {}
-            data = base64.b64decode(blob)
-            raw = zlib.decompress(data)
-            return json.loads(raw.decode("utf-8"))
-
-        if not query or not isinstance(query, str):
+    def _text_channel(self, query, k, filters=None, q_vec=None):
+        if q_vec is None:
+            q_vec = self.embedder.embed_text([query])[0]
+        return self.store.search_text(q_vec, top_k=k, filters=filters)
+
+    def _table_channel(self, query, k, filters=None, q_vec=None):
+        if self.table_mode == "text":
+            # 线性化表格的 bge-m3 向量，不再跑 TAPAS
+            if q_vec is None:
+                q_vec = self.embedder.embed_text([query])[0]
+            return self.store.search_table_text(q_vec, top_k=k, filters=filters)
+
+        # 表格通道使用 TAPAS embedding
+        q_vec_table = self.embedder.embed_query_table(query)
+        return self.store.search_table(q_vec_table, top_k=k, filters=filters)
+
+    def _get_bm25(self):
+        meta = os.path.join(settings.BM25_INDEX_DIR, "meta.json")
+        try:
+            mtime = os.stat(meta).st_mtime_ns
+        except FileNotFoundError:
+            # 没建过索引，或 save() 正在替换目录：继续用已加载的索引（从未加载过时为 None）
+            return self._bm25_index
+
+        if mtime != self._bm25_mtime:
+            with self._bm25_lock:
+                if mtime != self._bm25_mtime:
+                    try:
+                        self._bm25_index = BM25Index.load(settings.BM25_INDEX_DIR)
+                        self._bm25_mtime = mtime
+                    except Exception as e:
+                        # 可能正赶上 indexer 替换目录，下次再试
+                        print(f"⚠️ BM25 索引加载失败: {e}")
+        return self._bm25_index
+
+    def _bm25_channel(self, query, k, filters=None):
+        # 词法通道：产品编号、条款号、专有名词等向量检索容易漏掉的精确匹配
+        if not self.w_bm25:
             return []
+        index = self._get_bm25()
+        if index is None:
+            return []
+        return index.search(query, top_k=k, filters=filters)
+
+    def _run_channels(self, query, k, filters=None, timeout_cap=None, q_vec=None):
+        """
+        文本 / 表格两路并发执行（BM25 在本线程内同步完成，耗时可忽略），各自有独立超时（timeout_cap 用于延迟预算进一步收紧）；
+        某一路失败或超时只记日志并返回空，另一路结果照常参与融合。
+        """
+        start = time.perf_counter()
+
+        # text 模式：一次 bge-m3 推理同时驱动文本 / 表格两路
+        channels = {}
+        if q_vec is None and self.table_mode == "text":
+            q_vec = self._guarded_embed(lambda: self.embedder.embed_text([query])[0])
+
+        if q_vec is not None or self.table_mode != "text":
+            channels = {
+                "text": (self._channel_pool.submit(self._text_channel, query, k, filters, q_vec), self.text_timeout),
+                "table": (self._channel_pool.submit(self._table_channel, query, k, filters, q_vec), self.table_timeout),
+            }
 
-        # 1️⃣ Query → 文本 embedding
+        hits = {}
         try:
-            q_vec_text = self.embedder.embed_text([query])[0]
+            hits["bm25"] = self._bm25_channel(query, k, filters)
         except Exception as e:
-            print(f"❌ 文本 embedding 失败: {e}")
-            return []
+            print(f"⚠️ bm25 通道失败，仅使用其他通道结果: {e}")
+            hits["bm25"] = []
+
+        hits.update(self._collect(channels, start, timeout_cap, default=[]))
+        return hits.get("text", []), hits.get("table", []), hits["bm25"]
 
-        # 2️⃣ Query → 表格 embedding（关键步骤）
+    @staticmethod
+    def _guarded_embed(fn):
+        """query embedding 失败只记日志并返回 None，依赖它的向量通道跳过，BM25 照常"""
         try:
-            q_vec_table = self.embedder.embed_query_table(query)
+            return fn()
         except Exception as e:
-            print(f"⚠️ 表格 embedding 失败，fallback 文本模式: {e}")
-            q_vec_table = q_vec_text
+            print(f"❌ 文本 embedding 失败，跳过向量通道: {e}")
+            return None
+
+    @staticmethod
+    def _collect(channels, start, timeout_cap=None, default=None):
+        """
+        channels: {name: (future, timeout)}，按各自超时等待结果；
+        超时 / 失败的通道只记日志，结果为 default
+        """
+        out = {}
+        for name, (future, timeout) in channels.items():
+            if timeout_cap is not None:
+                timeout = min(timeout, timeout_cap)
+            remaining = timeout - (time.perf_counter() - start)
+            try:
+                out[name] = future.result(timeout=max(remaining, 0))
+            except FuturesTimeout:
+                future.cancel()
+                print(f"⚠️ {name} 通道超时（>{timeout}s），仅使用其他通道结果")
+                out[name] = default
+            except Exception as e:
+                print(f"⚠️ {name} 通道失败，仅使用其他通道结果: {e}")
+                out[name] = default
+        return out
 
-        # ---------------------------
-        # 多路检索
-        # ---------------------------
-        k_each = max(top_k * self.candidate_multiplier, top_k)
 
-        # 文本通道
-        text_hits = self.store.search_text(q_vec_text, top_k=k_each)
+    # ------------------------------------------------------
+    # 多 query 扩展：所有改写一次 batch embedding，每个向量字段一次多向量搜索
+    # 返回 _fuse 的 channels：每个改写的 text / table / bm25 三路，
+    # 原 query 权重 1，改写乘以 QUERY_EXPANSION_WEIGHT
+    # ------------------------------------------------------
+    def _channel_list(self, text_hits, table_hits, lexical_hits, weight=1.0):
+        return [
+            (text_hits, "text", self.w_text * weight),
+            (table_hits, "table", self.w_table * weight),
+            (lexical_hits, "bm25", self.w_bm25 * weight),
+        ]
 
-        # 表格通道（现在使用 TAPAS embedding）
-        table_hits = self.store.search_table(q_vec_table, top_k=k_each)
+    def _multi_query_channels(self, queries, text_hits, table_hits, lexical_hits):
+        """text / table / bm25 各是与 queries 对应的 hits 列表（table 在 tapas 模式下只有原 query 一项）"""
+        channels = []
+        for j in range(len(queries)):
+            weight = 1.0 if j == 0 else settings.QUERY_EXPANSION_WEIGHT
+            channels.extend(self._channel_list(
+                text_hits[j] if j < len(text_hits) else [],
+                table_hits[j] if j < len(table_hits) else [],
+                lexical_hits[j] if j < len(lexical_hits) else [],
+                weight,
+            ))
+        return channels
+
+    def _embed_variants(self, queries, q_vec=None):
+        """原 query 已有向量时只对改写做 embedding（一次 batch）"""
+        if q_vec is not None:
+            return [q_vec] + list(self.embedder.embed_text(queries[1:]))
+        return list(self.embedder.embed_text(queries))
+
+    def _run_multi_query(self, queries, k, filters=None, timeout_cap=None, q_vec=None):
+        start = time.perf_counter()
+        vecs = self._guarded_embed(lambda: self._embed_variants(queries, q_vec))
+
+        channels = {}
+        if vecs is not None:
+            channels["text"] = (
+                self._channel_pool.submit(self.store.search_batch, "text_vector", vecs, k, None, filters),
+                self.text_timeout,
+            )
+        if self.table_mode != "text":
+            # TAPAS 推理较贵，表格通道只查原 query
+            channels["table"] = (
+                self._channel_pool.submit(lambda: [self._table_channel(queries[0], k, filters)]),
+                self.table_timeout,
+            )
+        elif vecs is not None:
+            channels["table"] = (
+                self._channel_pool.submit(self.store.search_batch, "table_text_vector", vecs, k, None, filters),
+                self.table_timeout,
+            )
 
-        if not text_hits and not table_hits:
-            return []
+        try:
+            lexical_hits = [self._bm25_channel(q, k, filters) for q in queries]
+        except Exception as e:
+            print(f"⚠️ bm25 通道失败，仅使用其他通道结果: {e}")
+            lexical_hits = []
+
+        hits = self._collect(channels, start, timeout_cap, default=[])
+        return self._multi_query_channels(queries, hits.get("text", []), hits.get("table", []), lexical_hits)
 
-        # ------------------------------------------------------
-        # 3️⃣ RAG-Fusion
-        # ------------------------------------------------------
+
+    # ------------------------------------------------------
+    # RAG-Fusion：基于 reciprocal rank 的加权融合
+    # ------------------------------------------------------
+    @staticmethod
+    def _fuse(channels, candidate_count):
+        """
+        channels: [(hits, modality_label, weight), ...]
+        返回按 fusion_score 降序的前 candidate_count 个候选
+        """
         fusion_map = {}
 
-        def make_doc_id(ent):
+        def make_doc_id(hit, ent):
+            # 以 chunk id 为唯一 ID：同一个块在各通道（text / table / bm25）的命中融合在一起，
+            # 同页的其他文本块和表格各自保留，由 context_packer 按页合并
+            chunk_id = _hit_id(hit)
+            if chunk_id is not None:
+                return chunk_id
             meta = ent.get("metadata") or {}
-            source = meta.get("source", "unknown")
-            page = meta.get("page_number", "na")
-
-            # 两模态版本：以 PDF + 页码 为唯一 ID
-            # → 能把 table-hit 和 同页的 text-hit 自动融合
-            return f"{source}|p{page}"
+            return f"{meta.get('source', 'unknown')}|p{meta.get('page_number', 'na')}|{ent.get('text')}"
 
-        def _add_hits(hits, modality_label, weight):
+        for hits, modality_label, weight in channels:
             for rank, hit in enumerate(hits, start=1):
 
-                ent = hit.entity
-                doc_id = make_doc_id(ent)
+                ent = _hit_entity(hit)
+                doc_id = make_doc_id(hit, ent)
 
                 if doc_id not in fusion_map:
                     fusion_map[doc_id] = {
                         "fusion_score": 0.0,
                         "item": {
-                            "modality": modality_label,
+                            "id": _hit_id(hit),
+                            # bm25 通道混合了文本块和表格，以行自身的 modality 为准
+                            "modality": ent.get("modality") or modality_label,
                             "text": ent.get("text"),
-                            "table": decompress_table_blob(ent.get("table_blob")),
+                            # 只记录 digest，最终 top_k 才去 blob store 取表格
+                            "table_digest": ent.get("table_digest"),
                             "metadata": ent.get("metadata"),
                         }
                     }
 
                 fusion_map[doc_id]["fusion_score"] += weight * (1.0 / rank)
 
-        # ---- 多模态加入 fusion ----
-        _add_hits(text_hits, "text", self.w_text)
-        _add_hits(table_hits, "table", self.w_table)
-
-        _add_hits(text_hits,  "text",  self.w_text)
-        _add_hits(table_hits, "table", self.w_table)
-
-        if not fusion_map:
-            return []
-
-        # ------------------------------------------------------
-        # 4️⃣ topN 候选（先按 fusion_score 排序）
-        # ------------------------------------------------------
+        # topN 候选（先按 fusion_score 排序）
         fused_items = list(fusion_map.values())
         fused_items.sort(key=lambda x: x["fusion_score"], reverse=True)
+        return fused_items[:candidate_count]
+
 
-        candidate_count = min(len(fused_items), max(top_k * self.candidate_multiplier, top_k))
-        fused_items = fused_items[:candidate_count]
+    # ------------------------------------------------------
+    # reranker 精排 + 最终融合打分
+    # ------------------------------------------------------
+    @staticmethod
+    def _norm(x, lo, hi):
+        if hi <= lo:
+            return 0.5
+        return (x - lo) / (hi - lo)
 
+    def _rerank(self, query, fused_items, top_k):
         candidate_texts = [fi["item"]["text"] or "" for fi in fused_items]
+        candidate_ids = [fi["item"]["id"] for fi in fused_items]
+
+        t0 = time.perf_counter()
+        rerank_scores = self.reranker.rerank(query, candidate_texts, ids=candidate_ids)
+        self._observe_rerank_cost((time.perf_counter() - t0) * 1000, len(fused_items))
 
-        # ------------------------------------------------------
-        # 5️⃣ reranker 精排
-        # ------------------------------------------------------
-        rerank_scores = self.reranker.rerank(query, candidate_texts)
+        return self._combine(fused_items, rerank_scores, top_k)
 
+    def _combine(self, fused_items, rerank_scores, top_k):
+        """fusion 分数与 rerank 分数各自归一化后按 gamma 加权"""
         fusion_scores = [fi["fusion_score"] for fi in fused_items]
         f_max, f_min = max(fusion_scores), min(fusion_scores)
         r_max, r_min = max(rerank_scores), min(rerank_scores)
 
-        def _norm(x, lo, hi):
-            if hi <= lo:
-                return 0.5
-            return (x - lo) / (hi - lo)
-
         final_items = []
         for fi, f_s, r_s in zip(fused_items, fusion_scores, rerank_scores):
-            f_norm = _norm(f_s, f_min, f_max)
-            r_norm = _norm(r_s, r_min, r_max)
+            f_norm = self._norm(f_s, f_min, f_max)
+            r_norm = self._norm(r_s, r_min, r_max)
             relevance = self.gamma * r_norm + (1 - self.gamma) * f_norm
-            cost = 1.0 - relevance
+            final_items.append((fi["item"], 1.0 - relevance))
 
-            item = fi["item"]
-            final_items.append({
-                "text": item["text"],
-                "table": item["table"],
-                "metadata": item["metadata"],
-                "modality": item["modality"],
-                "score": cost,
-            })
-
-        # ------------------------------------------------------
-        # 6️⃣ 最终排序 + top_k
-        # ------------------------------------------------------
-        final_items.sort(key=lambda x: x["score"])
+        return self._finalize(final_items, top_k)
+
+    def _fusion_only(self, fused_items, top_k):
+        """跳过 reranker，直接按 fusion 分数输出"""
+        fusion_scores = [fi["fusion_score"] for fi in fused_items]
+        f_max, f_min = max(fusion_scores), min(fusion_scores)
+
+        final_items = [
+            (fi["item"], 1.0 - self._norm(f_s, f_min, f_max))
+            for fi, f_s in zip(fused_items, fusion_scores)
+        ]
+        return self._finalize(final_items, top_k)
+
+    def _finalize(self, final_items, top_k):
+        """final_items: [(item, cost), ...] → 最终排序 + top_k + 输出格式"""
+        final_items.sort(key=lambda x: x[1])
         final_items = final_items[:top_k]
 
-        # 输出格式保持和旧版一致
+        # 输出格式保持和旧版一致（表格在这里懒加载，经 LRU 缓存）
         return [
             {
-                "text": it["text"],
-                "table": it["table"],
-                "score": round(float(it["score"]), 4),
-                "metadata": it["metadata"],
+                "id": item["id"],
+                "text": item["text"],
+                "table": self.blob_store.get_table(item["table_digest"]),
+                "score": round(float(cost), 4),
+                "metadata": item["metadata"],
             }
-            for it in final_items
+            for item, cost in final_items
         ]
 
 
+    # ------------------------------------------------------
+    # 延迟预算：自适应候选数 + 跳过 rerank
+    # ------------------------------------------------------
+    def _observe_rerank_cost(self, elapsed_ms, n):
+        """EWMA 估计每个候选的 rerank 耗时（缓存命中会自然拉低估计）"""
+        if n <= 0:
+            return
+        per_item = elapsed_ms / n
+        with self._cost_lock:
+            self._rerank_ms_per_item = 0.8 * self._rerank_ms_per_item + 0.2 * per_item
+
+    def _candidate_count(self, top_k, budget_ms):
+        """候选数：默认 top_k * candidate_multiplier，有预算时按 rerank 可负担的数量收缩"""
+        k_each = max(top_k * self.candidate_multiplier, top_k)
+        if budget_ms:
+            affordable = int(budget_ms * settings.RERANK_BUDGET_SHARE / self._rerank_ms_per_item)
+            k_each = max(top_k, min(k_each, affordable))
+        return k_each
+
+    def _plan_rerank(self, fused_items, top_k, start, budget_ms):
+        """
+        决定是否 rerank、rerank 多少个候选。
+        返回 (要 rerank 的候选 或 None, path)
+        path:
+            rerank         —— 完整精排
+            rerank_shrunk  —— 剩余预算不够，只精排前 n 个
+            fusion_margin  —— fusion 第一名已遥遥领先，跳过精排
+            budget_skip    —— 预算几乎用完，跳过精排
+        """
+        if not budget_ms:
+            return fused_items, "rerank"
+
+        if len(fused_items) >= 2:
+            first = fused_items[0]["fusion_score"]
+            second = fused_items[1]["fusion_score"]
+            if first > 0 and (first - second) / first >= settings.RERANK_SKIP_MARGIN:
+                return None, "fusion_margin"
+
+        remaining = budget_ms - (time.perf_counter() - start) * 1000
+        affordable = int(remaining / self._rerank_ms_per_item)
+        if affordable < min(top_k, len(fused_items)):
+            return None, "budget_skip"
+
+        if affordable < len(fused_items):
+            return fused_items[:affordable], "rerank_shrunk"
+        return fused_items, "rerank"
+
+    @staticmethod
+    def _info(path, start, budget_ms, candidates=0, pool=0):
+        return {
+            "path": path,
+            "candidates": candidates,
+            "candidate_pool": pool,     # 召回阶段每路取的候选数（预算会收缩它）
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "budget_ms": budget_ms,
+        }
+
+
+    # ------------------------------------------------------
+    # 检索结果缓存：key 含索引版本号，索引一提交就自动失效
+    # ------------------------------------------------------
+    @staticmethod
+    def normalize_query(query):
+        if not isinstance(query, str):
+            return ""
+        query = unicodedata.normalize("NFKC", query)
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    def _cache_key(self, query, top_k, filters, expanded=True, vector_tag=None):
+        """
+        expanded=False：调用方不做 query 扩展（retrieve_batch），与扩展后的结果分开缓存
+        vector_tag：text_vector 不是 query 本身的 embedding 时用来区分的标识
+        """
+        expansion = (self.expander.mode, self.expander.max_variants) if expanded and self.expander.enabled else None
+        return (
+            self.normalize_query(query),
+            top_k,
+            json.dumps(filters or {}, ensure_ascii=False, sort_keys=True),
+            self.w_text,
+            self.w_table,
+            self.w_bm25,
+            self.table_mode,
+            expansion,
+            vector_tag,
+            self.gamma,
+            self.candidate_multiplier,
+            read_index_version(),
+        )
+
+    def _store_result(self, key, results, info, top_k):
+        # 缓存 key 不含延迟预算，只缓存与无预算调用等价的结果：
+        # 完整精排且候选数未被预算收缩；fusion_margin / rerank_shrunk / budget_skip 都不缓存
+        if (
+            results
+            and info["path"] == "rerank"
+            and info.get("candidate_pool") == self._candidate_count(top_k, None)
+        ):
+            self.result_cache.set(key, results)
+
+    def _from_cache(self, cached, start, budget_ms):
+        results = [dict(r) for r in cached]
+        return results, self._info("cache", start, budget_ms, len(results))
+
+
+    # ------------------------------------------------------
+    # 核心接口
+    # ------------------------------------------------------
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: dict = None,
+        budget_ms: float = None,
+        with_info: bool = False,
+        text_vector=None,
+        vector_tag: str = None,
+    ):
+        """
+        budget_ms：可选的延迟预算（毫秒），会收缩候选数、必要时跳过 rerank
+        with_info：为 True 时返回 (results, info)，info["path"] 说明走了哪条路径
+        text_vector：调用方已算好的 query bge-m3 向量（如语义缓存），避免重复推理
+        vector_tag：text_vector 不等于 query 的 embedding 时（如多轮会话的合并向量）必须传入，
+                    参与结果缓存 key，避免与普通调用互相命中
+        """
+        start = time.perf_counter()
+
+        self._sync_index_version()
+        key = self._cache_key(query, top_k, filters, vector_tag=vector_tag)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            results, info = self._from_cache(cached, start, budget_ms)
+        else:
+            results, info = self._retrieve(query, top_k, filters, budget_ms, start, text_vector)
+            self._store_result(key, results, info, top_k)
+
+        return (results, info) if with_info else results
+
+    def _retrieve(self, query, top_k, filters, budget_ms, start, text_vector=None):
+
+        if not query or not isinstance(query, str):
+            return [], self._info("empty", start, budget_ms)
+
+        # 1️⃣ 多路检索（文本 / 表格并发 + BM25，延迟约等于较慢的一路）
+        #    开启 query 扩展时，所有改写共用一次 embedding 和一次多向量搜索
+        k_each = self._candidate_count(top_k, budget_ms)
+        timeout_cap = budget_ms / 1000 if budget_ms else None
+        queries = self.expander.expand(query)
+        if len(queries) > 1:
+            channels = self._run_multi_query(queries, k_each, filters, timeout_cap, text_vector)
+        else:
+            channels = self._channel_list(*self._run_channels(
+                query, k_each, filters, timeout_cap=timeout_cap, q_vec=text_vector,
+            ))
+
+        if not any(hits for hits, _, _ in channels):
+            return [], self._info("empty", start, budget_ms)
+
+        # 2️⃣ RAG-Fusion → topN 候选（候选数不随改写数增加）
+        fused_items = self._fuse(channels, candidate_count=k_each)
+
+        if not fused_items:
+            return [], self._info("empty", start, budget_ms)
+
+        # 3️⃣ reranker 精排 + top_k（有预算时可能收缩或跳过）
+        to_rerank, path = self._plan_rerank(fused_items, top_k, start, budget_ms)
+        if to_rerank is None:
+            results = self._fusion_only(fused_items, top_k)
+            return results, self._info(path, start, budget_ms, len(fused_items), k_each)
+
+        results = self._rerank(query, to_rerank, top_k)
+        return results, self._info(path, start, budget_ms, len(to_rerank), k_each)
+
+
+    # ------------------------------------------------------
+    # 异步接口：供 FastAPI 等 event loop 内的调用方使用
+    # ------------------------------------------------------
+    async def _infer(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._infer_pool, fn, *args)
+
+    async def aembed_query(self, query):
+        """query 的 bge-m3 向量（可再传给 aretrieve(text_vector=...) 复用）"""
+        return (await self._infer(self.embedder.embed_text, [query]))[0]
+
+    async def _atext_channel(self, query, k, filters=None, q_vec=None):
+        if q_vec is None:
+            q_vec = await self.aembed_query(query)
+        return await self.store.asearch_text(q_vec, top_k=k, filters=filters)
+
+    async def _atable_channel(self, query, k, filters=None, q_vec=None):
+        if self.table_mode == "text":
+            if q_vec is None:
+                q_vec = await self.aembed_query(query)
+            return await self.store.asearch_table_text(q_vec, top_k=k, filters=filters)
+
+        q_vec_table = await self._infer(self.embedder.embed_query_table, query)
+        return await self.store.asearch_table(q_vec_table, top_k=k, filters=filters)
+
+    async def _abm25_channel(self, query, k, filters=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._channel_pool, self._bm25_channel, query, k, filters)
+
+    @staticmethod
+    async def _guarded(name, coro, timeout, timeout_cap=None):
+        """单路超时 / 失败只记日志并返回空，其他通道照常参与融合"""
+        if timeout_cap is not None:
+            timeout = min(timeout, timeout_cap)
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {name} 通道超时（>{timeout}s），仅使用其他通道结果")
+        except Exception as e:
+            print(f"⚠️ {name} 通道失败，仅使用其他通道结果: {e}")
+        return []
+
+    @staticmethod
+    async def _empty():
+        return []
+
+    async def _aguarded_embed(self, fn, *args):
+        """_guarded_embed 的协程版本（推理走线程池）"""
+        try:
+            return await self._infer(fn, *args)
+        except Exception as e:
+            print(f"❌ 文本 embedding 失败，跳过向量通道: {e}")
+            return None
+
+    async def _arun_channels(self, query, k, filters=None, timeout_cap=None, q_vec=None):
+        vectors_ok = True
+        if q_vec is None and self.table_mode == "text":
+            q_vec = await self._aguarded_embed(lambda: self.embedder.embed_text([query])[0])
+            vectors_ok = q_vec is not None
+
+        text_coro = self._atext_channel(query, k, filters, q_vec) if vectors_ok else self._empty()
+        table_coro = self._atable_channel(query, k, filters, q_vec) if vectors_ok else self._empty()
+        return await asyncio.gather(
+            self._guarded("text", text_coro, self.text_timeout, timeout_cap),
+            self._guarded("table", table_coro, self.table_timeout, timeout_cap),
+            self._guarded("bm25", self._abm25_channel(query, k, filters), self.text_timeout, timeout_cap),
+        )
+
+    async def _arun_multi_query(self, queries, k, filters=None, timeout_cap=None, q_vec=None):
+        """_run_multi_query 的协程版本：embedding 走推理线程池，搜索走 AsyncMilvusClient"""
+        vecs = await self._aguarded_embed(self._embed_variants, queries, q_vec)
+
+        if vecs is None:
+            text_coro = self._empty()
+        else:
+            text_coro = self.store.asearch_batch("text_vector", vecs, top_k=k, filters=filters)
+
+        if self.table_mode == "text":
+            table_coro = (
+                self._empty() if vecs is None
+                else self.store.asearch_batch("table_text_vector", vecs, top_k=k, filters=filters)
+            )
+        else:
+            async def _tapas_original():
+                return [await self._atable_channel(queries[0], k, filters)]
+            table_coro = _tapas_original()
+
+        async def _bm25_all():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._channel_pool, lambda: [self._bm25_channel(q, k, filters) for q in queries]
+            )
+
+        text_hits, table_hits, lexical_hits = await asyncio.gather(
+            self._guarded("text", text_coro, self.text_timeout, timeout_cap),
+            self._guarded("table", table_coro, self.table_timeout, timeout_cap),
+            self._guarded("bm25", _bm25_all(), self.text_timeout, timeout_cap),
+        )
+        return self._multi_query_channels(queries, text_hits, table_hits, lexical_hits)
+
+    async def aretrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: dict = None,
+        budget_ms: float = None,
+        with_info: bool = False,
+        text_vector=None,
+        vector_tag: str = None,
+    ):
+        """retrieve 的协程版本，参数与返回格式完全一致"""
+        start = time.perf_counter()
+
+        if read_index_version() != self._index_version:
+            # refresh 走同步 ORM 调用，放到线程池里，不阻塞 event loop
+            await asyncio.get_running_loop().run_in_executor(self._infer_pool, self._sync_index_version)
+        key = self._cache_key(query, top_k, filters, vector_tag=vector_tag)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            results, info = self._from_cache(cached, start, budget_ms)
+        else:
+            results, info = await self._aretrieve(query, top_k, filters, budget_ms, start, text_vector)
+            self._store_result(key, results, info, top_k)
+
+        return (results, info) if with_info else results
+
+    async def _aretrieve(self, query, top_k, filters, budget_ms, start, text_vector=None):
+
+        if not query or not isinstance(query, str):
+            return [], self._info("empty", start, budget_ms)
+
+        k_each = self._candidate_count(top_k, budget_ms)
+        timeout_cap = budget_ms / 1000 if budget_ms else None
+        queries = await self.expander.aexpand(query)
+        if len(queries) > 1:
+            channels = await self._arun_multi_query(queries, k_each, filters, timeout_cap, text_vector)
+        else:
+            channels = self._channel_list(*await self._arun_channels(
+                query, k_each, filters, timeout_cap=timeout_cap, q_vec=text_vector,
+            ))
+
+        if not any(hits for hits, _, _ in channels):
+            return [], self._info("empty", start, budget_ms)
+
+        fused_items = self._fuse(channels, candidate_count=k_each)
+
+        if not fused_items:
+            return [], self._info("empty", start, budget_ms)
+
+        to_rerank, path = self._plan_rerank(fused_items, top_k, start, budget_ms)
+        if to_rerank is None:
+            results = await self._infer(self._fusion_only, fused_items, top_k)
+            return results, self._info(path, start, budget_ms, len(fused_items), k_each)
+
+        results = await self._infer(self._rerank, query, to_rerank, top_k)
+        return results, self._info(path, start, budget_ms, len(to_rerank), k_each)
+
+
+    # ------------------------------------------------------
+    # 批量接口：离线评测 / 批量问答
+    # ------------------------------------------------------
+    def _batch_channels(self, queries, k, filters=None):
+        """所有 query 分批 embedding，再以多向量搜索一次查多个 query"""
+        batch_size = settings.EMBED_BATCH_SIZE
+        text_vecs = self.embedder.embed_texts(queries, batch_size=batch_size)
+        text_hits = self.store.search_batch("text_vector", text_vecs, top_k=k, filters=filters)
+
+        if self.table_mode == "text":
+            table_hits = self.store.search_batch("table_text_vector", text_vecs, top_k=k, filters=filters)
+        else:
+            # TAPAS 的 query 表格各不相同，无法拼 batch，只能逐条推理
+            table_vecs = [self.embedder.embed_query_table(q) for q in queries]
+            table_hits = self.store.search_batch("table_vector", table_vecs, top_k=k, filters=filters)
+
+        lexical_hits = [self._bm25_channel(q, k, filters) for q in queries]
+        return text_hits, table_hits, lexical_hits
+
+    def retrieve_batch(self, queries, top_k: int = 5, filters: dict = None):
+        """
+        批量检索，输出与逐条调用 retrieve 一致（List[List[dict]]，顺序对应 queries）。
+        embedding、Milvus 搜索、rerank 都按批进行，不做延迟预算。
+        """
+        self._sync_index_version()
+        outputs = [[] for _ in queries]
+        keys = [self._cache_key(q, top_k, filters, expanded=False) for q in queries]
+
+        todo = []
+        for i, (q, key) in enumerate(zip(queries, keys)):
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                outputs[i] = [dict(r) for r in cached]
+            elif q and isinstance(q, str):
+                todo.append(i)
+
+        if not todo:
+            return outputs
+
+        # 1️⃣ 多路检索（批量 embedding + 多向量搜索）
+        k_each = self._candidate_count(top_k, None)
+        pending = [queries[i] for i in todo]
+        text_hits, table_hits, lexical_hits = self._batch_channels(pending, k_each, filters)
+
+        # 2️⃣ 每个 query 各自 RAG-Fusion
+        fused = [
+            self._fuse(
+                [
+                    (text_hits[j], "text", self.w_text),
+                    (table_hits[j], "table", self.w_table),
+                    (lexical_hits[j], "bm25", self.w_bm25),
+                ],
+                candidate_count=k_each,
+            )
+            for j in range(len(todo))
+        ]
+
+        # 3️⃣ 所有 (query, candidate) 混在一起 rerank
+        live = [j for j, items in enumerate(fused) if items]
+        rerank_scores = self.reranker.rerank_batch(
+            [pending[j] for j in live],
+            [[fi["item"]["text"] or "" for fi in fused[j]] for j in live],
+            [[fi["item"]["id"] for fi in fused[j]] for j in live],
+        )
+
+        for j, scores in zip(live, rerank_scores):
+            i = todo[j]
+            outputs[i] = self._combine(fused[j], scores, top_k)
+            self._store_result(keys[i], outputs[i], {"path": "rerank", "candidate_pool": k_each}, top_k)
+
+        return outputs
+
+
     # ------------------------------------------------------
     # 上下文拼接接口
     # ------------------------------------------------------
-    def retrieve_context(self, query: str, top_k: int = 5):
+    def retrieve_context(self, query: str, top_k: int = 5, max_tokens: int = None):
+        """合并同页相邻块、去重叠、渲染表格，并按 token 预算截取"""
         hits = self.retrieve(query, top_k=top_k)
-        return "\n---\n".join([h["text"] for h in hits if h["text"]])
+        if max_tokens is None:
+            max_tokens = settings.CONTEXT_MAX_TOKENS
+        return "\n---\n".join(pack_context(hits, max_tokens))
 
 
 # -------------------------
@@ -0,0 +1,182 @@
+"""
+索引 profile benchmark
+
+在当前 IRAG_MM collection 的真实向量上，对比各索引 profile 的：
+- recall@k（相对 numpy 精确检索）
+- 单条查询 p50 / p99 延迟
+- 索引内存（segment mem_size）
+
+每个 profile 会建一个临时 collection（{collection}_bench_{profile}），测完即删。
+
+用法：
+    uv run python -m scripts.bench_index
+    uv run python -m scripts.bench_index --profiles HNSW HNSW_SQ IVF_PQ --k 10 --num-queries 200
+    uv run python -m scripts.bench_index --field table_vector
+    uv run python -m scripts.bench_index --field table_text_vector
+    uv run python -m scripts.bench_index --queries-file faq.txt --ef 128
+"""
+
+import argparse
+import time
+
+import numpy as np
+from pymilvus import (
+    FieldSchema, CollectionSchema, DataType, Collection, utility
+)
+
+from storage.milvus_store import MilvusVectorStore
+from storage.index_profiles import INDEX_PROFILES, build_index_params, build_search_params
+
+
+def load_vectors(store, field):
+    """读出某个向量字段的全部 (id, vector)，只取对应模态的行"""
+    modality = "text" if field == "text_vector" else "table"
+    it = store.collection.query_iterator(
+        batch_size=1000,
+        expr=f'modality == "{modality}"',
+        output_fields=["id", field],
+    )
+
+    ids, vecs = [], []
+    while True:
+        batch = it.next()
+        if not batch:
+            it.close()
+            break
+        for row in batch:
+            ids.append(row["id"])
+            vecs.append(row[field])
+
+    return np.array(ids, dtype="int64"), np.array(vecs, dtype="float32")
+
+
+def exact_topk(base, queries, k):
+    """COSINE 精确检索，返回每个 query 的 top-k 行号"""
+    def _normalize(x):
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return x / norms
+
+    sims = _normalize(queries) @ _normalize(base).T
+    return np.argsort(-sims, axis=1)[:, :k]
+
+
+def percentile(values, p):
+    return float(np.percentile(np.array(values), p)) if values else 0.0
+
+
+def bench_profile(profile, base_name, ids, vecs, queries, truth_ids, k, overrides):
+    name = f"{base_name}_bench_{profile.lower()}"
+    if utility.has_collection(name):
+        utility.drop_collection(name)
+
+    dim = vecs.shape[1]
+    schema = CollectionSchema(fields=[
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+    ])
+    collection = Collection(name, schema)
+
+    try:
+        for start in range(0, len(ids), 1000):
+            collection.insert([
+                ids[start:start + 1000].tolist(),
+                vecs[start:start + 1000].tolist(),
+            ])
+        collection.flush()
+
+        t0 = time.perf_counter()
+        collection.create_index("vector", build_index_params(profile))
+        utility.wait_for_index_building_complete(name)
+        build_s = time.perf_counter() - t0
+
+        collection.load()
+        param = build_search_params(profile, overrides, limit=k)
+
+        # 预热，避免第一次查询的冷启动影响 p99
+        collection.search(data=[queries[0].tolist()], anns_field="vector", param=param, limit=k)
+
+        latencies, recalls = [], []
+        for q, truth in zip(queries, truth_ids):
+            t0 = time.perf_counter()
+            res = collection.search(data=[q.tolist()], anns_field="vector", param=param, limit=k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+            got = {hit.id for hit in res[0]}
+            recalls.append(len(got & truth) / k)
+
+        segments = utility.get_query_segment_info(name)
+        mem = sum(getattr(s, "mem_size", 0) for s in segments)
+
+        return {
+            "profile": profile,
+            "recall": float(np.mean(recalls)),
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "mem_mb": mem / 1024 / 1024,
+            "build_s": build_s,
+        }
+    finally:
+        collection.release()
+        utility.drop_collection(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRAG index profile benchmark")
+    parser.add_argument("--profiles", nargs="+", default=[p for p in INDEX_PROFILES if p != "FLAT"])
+    parser.add_argument("--field", default="text_vector", choices=["text_vector", "table_vector", "table_text_vector"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--queries-file", default=None, help="每行一个真实问题（text_vector / table_text_vector）")
+    parser.add_argument("--ef", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    store = MilvusVectorStore()
+    ids, vecs = load_vectors(store, args.field)
+    if len(ids) == 0:
+        print(f"⚠️ {args.field} 没有可用向量，请先构建索引。")
+        return
+    print(f"📦 读取 {len(ids)} 条 {args.field} 向量")
+
+    if args.queries_file:
+        from embedding.embedder import Embedder
+        with open(args.queries_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        queries = np.asarray(Embedder().embed_text(texts), dtype="float32")
+    else:
+        # 默认用库内向量做自查询
+        rng = np.random.default_rng(args.seed)
+        pick = rng.choice(len(ids), size=min(args.num_queries, len(ids)), replace=False)
+        queries = vecs[pick]
+
+    k = min(args.k, len(ids))
+    truth_rows = exact_topk(vecs, queries, k)
+    truth_ids = [set(ids[row].tolist()) for row in truth_rows]
+
+    overrides = {}
+    if args.ef is not None:
+        overrides["ef"] = args.ef
+    if args.nprobe is not None:
+        overrides["nprobe"] = args.nprobe
+
+    results = []
+    for profile in args.profiles:
+        profile = profile.upper()
+        print(f"⏱️ 测试 {profile} ...")
+        try:
+            results.append(bench_profile(
+                profile, store.collection_name, ids, vecs, queries, truth_ids, k, overrides
+            ))
+        except Exception as e:
+            print(f"❌ {profile} 失败: {e}")
+
+    print(f"\n{'profile':<10} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8} {'mem MB':>8} {'build s':>8}")
+    for r in results:
+        print(f"{r['profile']:<10} {r['recall']:>10.4f} {r['p50']:>8.2f} {r['p99']:>8.2f} "
+              f"{r['mem_mb']:>8.1f} {r['build_s']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
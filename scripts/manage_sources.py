@@ -0,0 +1,61 @@
+"""
+文档级索引管理
+
+    uv run python -m scripts.manage_sources list
+    uv run python -m scripts.manage_sources delete sourcepdf/AIA/accident/GrandVIP_sc.pdf
+    uv run python -m scripts.manage_sources reindex sourcepdf/AIA/accident/GrandVIP_sc.pdf
+    uv run python -m scripts.manage_sources sync          # 只更新有变化的文档
+"""
+
+import argparse
+import sys
+
+from config.settings import settings
+from ingestion.indexer import build_bm25_index, build_index, make_doc_id, reindex_document
+from storage.milvus_store import MilvusVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRAG document-level index management")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("list", help="列出已索引文档、行数与内容 hash")
+
+    p_delete = sub.add_parser("delete", help="删除某个文档的全部行")
+    p_delete.add_argument("path")
+
+    p_reindex = sub.add_parser("reindex", help="重新解析并替换某个文档")
+    p_reindex.add_argument("path")
+
+    p_sync = sub.add_parser("sync", help="增量同步整个目录（跳过未变化文档）")
+    p_sync.add_argument("source_dir", nargs="?", default=settings.SOURCE_DIR)
+
+    args = parser.parse_args()
+
+    if args.cmd == "list":
+        sources = MilvusVectorStore().list_sources()
+        for s in sources:
+            print(f"{s['rows']:>6}  {s['doc_hash'][:12]}  {s['doc_id']}")
+        print(f"共 {len(sources)} 个文档，{sum(s['rows'] for s in sources)} 行。")
+
+    elif args.cmd == "delete":
+        store = MilvusVectorStore()
+        doc_id = make_doc_id(args.path)
+        n = store.delete_source(doc_id)
+        if not n:
+            sys.exit(f"❌ 没有匹配的行：{doc_id}（用 list 查看已索引的 doc_id）")
+        build_bm25_index(store)
+        print(f"🗑️ 已删除 {n} 行：{doc_id}")
+
+    elif args.cmd == "reindex":
+        try:
+            reindex_document(args.path)
+        except ValueError as e:
+            sys.exit(f"❌ {e}（新文档请用 sync 加入索引）")
+
+    elif args.cmd == "sync":
+        build_index(args.source_dir, incremental=True)
+
+
+if __name__ == "__main__":
+    main()
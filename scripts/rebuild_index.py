@@ -0,0 +1,22 @@
+"""
+蓝绿重建索引（零停机）
+
+    uv run python -m scripts.rebuild_index
+    uv run python -m scripts.rebuild_index --retain 3
+    uv run python -m scripts.rebuild_index --drop-legacy   # 首次从同名旧 collection 迁移
+"""
+
+import argparse
+
+from config.settings import settings
+from ingestion.indexer import rebuild_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IRAG blue/green index rebuild")
+    parser.add_argument("source_dir", nargs="?", default=settings.SOURCE_DIR)
+    parser.add_argument("--retain", type=int, default=None, help="保留的版本数（默认 MILVUS_RETAIN_VERSIONS）")
+    parser.add_argument("--drop-legacy", action="store_true", help="删除与 alias 同名的旧 collection")
+    args = parser.parse_args()
+
+    rebuild_index(args.source_dir, retain=args.retain, drop_legacy=args.drop_legacy)
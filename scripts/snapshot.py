@@ -0,0 +1,65 @@
+"""
+知识库快照：导出 / 导入 Parquet（跳过 PDF → TAPAS / bge-m3 全流程）
+
+    uv run python -m scripts.snapshot export snapshots/2025-01-01
+    uv run python -m scripts.snapshot import snapshots/2025-01-01
+    uv run python -m scripts.snapshot import snapshots/2025-01-01 --remote-prefix snapshots/2025-01-01
+
+导入会写入新的版本化 collection，校验通过后切换 alias（与蓝绿重建相同）。
+--remote-prefix：part 文件已拷贝到 Milvus 对象存储（MinIO/S3 bucket）该前缀下时，
+走 do_bulk_insert 批量导入；不指定则从本地目录流式 insert。
+"""
+
+import argparse
+
+from ingestion.indexer import build_bm25_index
+from storage.blob_store import TableBlobStore
+from storage.milvus_store import MilvusVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRAG collection snapshot export/import")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_export = sub.add_parser("export")
+    p_export.add_argument("out_dir")
+    p_export.add_argument("--rows-per-file", type=int, default=10000)
+
+    p_import = sub.add_parser("import")
+    p_import.add_argument("in_dir")
+    p_import.add_argument("--remote-prefix", default=None)
+    p_import.add_argument("--no-promote", action="store_true", help="只导入，不切换 alias")
+    p_import.add_argument("--drop-legacy", action="store_true")
+
+    args = parser.parse_args()
+    blob_store = TableBlobStore()
+
+    if args.cmd == "export":
+        MilvusVectorStore().export_parquet(
+            args.out_dir, rows_per_file=args.rows_per_file, blob_store=blob_store
+        )
+
+    elif args.cmd == "import":
+        store = MilvusVectorStore.create_version()
+        try:
+            rows = store.import_parquet(
+                args.in_dir, remote_prefix=args.remote_prefix, blob_store=blob_store
+            )
+        except Exception:
+            store.drop()
+            raise
+
+        if rows == 0:
+            print("❌ 快照为空，已丢弃新 collection。")
+            store.drop()
+            return
+
+        if not args.no_promote:
+            # 同 rebuild_index：先换 BM25 再切 alias，版本号只在 promote 里 bump 一次
+            build_bm25_index(store, blob_store, bump=False)
+            store.promote(drop_legacy=args.drop_legacy)
+            MilvusVectorStore.gc_versions()
+
+
+if __name__ == "__main__":
+    main()
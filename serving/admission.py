@@ -0,0 +1,144 @@
+"""
+准入控制：按阶段限制并发，超出部分在有界队列里等待，队列满了直接拒绝
+
+- inference：问题 embedding + 检索 + rerank（占 CPU / GPU）
+- llm：调用上游 LLM（占连接和上游配额）
+
+每个阶段 = 信号量（并发上限）+ 排队上限 + 排队超时：
+- 有空位：直接进入
+- 无空位且排队数 < max_queue：排队，最多等 queue_timeout 秒
+- 队列已满：立即抛 Overloaded(429)；排队超时：抛 Overloaded(503)
+两者都带 retry_after（按近期平均处理时间和排队长度估计）。
+突发流量时多出来的请求被快速拒绝，已进入的请求延迟不受影响。
+
+stats() 提供当前并发 / 排队数、拒绝次数和排队时间（/api/metrics）。
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from config.settings import settings
+
+
+class Overloaded(Exception):
+    """阶段过载，请求被拒绝"""
+
+    def __init__(self, stage, status_code, retry_after):
+        super().__init__(f"{stage} stage overloaded")
+        self.stage = stage
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Stage:
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+        self._waits = deque(maxlen=1000)    # 最近的排队时间（秒）
+        self._service = None                # 处理时间的指数滑动平均（秒）
+
+        # Semaphore 绑定 event loop，按 loop 懒加载
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def retry_after(self):
+        """排在队尾的请求大约还要等多久（秒，至少 1）"""
+        per_item = self._service or 1.0
+        return max(1, math.ceil(per_item * (self.waiting + 1) / self.concurrency))
+
+    def full(self):
+        """现在进来的请求会不会被直接拒绝"""
+        return self.active >= self.concurrency and self.waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        semaphore = self._ensure_semaphore()
+
+        if semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.name, 429, self.retry_after())
+
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            async with asyncio.timeout(self.queue_timeout or None):
+                await semaphore.acquire()
+        except TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(self.name, 503, self.retry_after())
+        finally:
+            self.waiting -= 1
+
+        entered = time.monotonic()
+        self._waits.append(entered - start)
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            semaphore.release()
+            elapsed = time.monotonic() - entered
+            self._service = elapsed if self._service is None else 0.8 * self._service + 0.2 * elapsed
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def _pct(p):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1)
+
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": _pct(0.95),
+            "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+            "service_ms_avg": round((self._service or 0.0) * 1000, 1),
+        }
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self.inference = Stage(
+            "inference",
+            settings.ADMISSION_INFERENCE_CONCURRENCY,
+            settings.ADMISSION_INFERENCE_QUEUE,
+            settings.ADMISSION_QUEUE_TIMEOUT,
+        )
+        self.llm = Stage(
+            "llm",
+            settings.ADMISSION_LLM_CONCURRENCY or settings.LLM_MAX_CONCURRENCY,
+            settings.ADMISSION_LLM_QUEUE,
+            settings.ADMISSION_QUEUE_TIMEOUT,
+        )
+
+    def stats(self):
+        return {"inference": self.inference.stats(), "llm": self.llm.stats()}
@@ -0,0 +1,200 @@
+"""
+LLM 回答缓存（替代 api_server 里无界的 LLM_CACHE dict）
+
+- 内存层：LRU + TTL，同时限制条目数和总字节数
+- 磁盘层（可选）：本地 SQLite，进程重启后仍可命中，多个 worker 共享同一文件
+- key = hash(模型, mode, 问题, 索引版本号, 检索到的 refs)，
+  索引更新或检索结果变化后自然不再命中，不会返回过期回答
+- stats() 提供命中 / 未命中等指标（/api/metrics）
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config.settings import settings
+
+
+class AnswerCache:
+
+    def __init__(self, path: str = None, maxsize: int = None, max_bytes: int = None,
+                 ttl: float = None, disk_rows: int = None):
+        self.path = settings.ANSWER_CACHE_DB if path is None else path
+        self.maxsize = settings.ANSWER_CACHE_SIZE if maxsize is None else maxsize
+        self.max_bytes = settings.ANSWER_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.ttl = settings.ANSWER_CACHE_TTL if ttl is None else ttl
+        self.disk_rows = settings.ANSWER_CACHE_DISK_ROWS if disk_rows is None else disk_rows
+
+        self._data = OrderedDict()     # key → (answer, size, created_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        if self.path:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY,"
+            " answer TEXT NOT NULL,"
+            " created_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created_at)")
+        self._conn.commit()
+
+    def reopen(self):
+        """fork 之后在子进程中调用：SQLite 连接不能跨进程共享"""
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        if self.path:
+            self._connect()
+
+    # ------------------------------------------------------------------
+    # key
+    # ------------------------------------------------------------------
+    @staticmethod
+    def make_key(model, mode, question, index_version, refs):
+        """refs：检索结果（取 id + text），检索结果变了 key 就变"""
+        refs_digest = hashlib.sha1(
+            json.dumps(
+                [[r.get("id"), r.get("text") or ""] for r in refs],
+                ensure_ascii=False,
+            ).encode("utf-8")
+        ).hexdigest()
+
+        raw = json.dumps(
+            [model, mode, question.strip(), index_version, refs_digest],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------------
+    def _expired(self, created_at, now):
+        return bool(self.ttl) and now - created_at > self.ttl
+
+    def _put_memory(self, key, answer, created_at):
+        size = len(answer.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (answer, size, created_at)
+            self._bytes += size
+            while self._data and (len(self._data) > self.maxsize or self._bytes > self.max_bytes):
+                _, (_, s, _) = self._data.popitem(last=False)
+                self._bytes -= s
+                self.evictions += 1
+
+    def get(self, key):
+        now = time.time()
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                answer, size, created_at = entry
+                if not self._expired(created_at, now):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return answer
+                del self._data[key]
+                self._bytes -= size
+
+        if self._conn is not None:
+            try:
+                with self._db_lock:
+                    row = self._conn.execute(
+                        "SELECT answer, created_at FROM answers WHERE key = ?", (key,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                print(f"⚠️ 回答缓存读取失败: {e}")
+                row = None
+
+            if row is not None and not self._expired(row[1], now):
+                self._put_memory(key, row[0], row[1])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, answer):
+        if not answer:
+            return
+        now = time.time()
+        self._put_memory(key, answer, now)
+
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, answer, created_at) VALUES (?, ?, ?)",
+                    (key, answer, now),
+                )
+                # 过期 / 超出行数上限的清理每 100 次写入做一次
+                self._writes += 1
+                if self._writes % 100 == 1:
+                    if self.ttl:
+                        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+                    if self.disk_rows:
+                        self._conn.execute(
+                            "DELETE FROM answers WHERE key IN ("
+                            " SELECT key FROM answers ORDER BY created_at DESC LIMIT -1 OFFSET ?"
+                            ")",
+                            (self.disk_rows,),
+                        )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ 回答缓存写入失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.execute("DELETE FROM answers")
+                self._conn.commit()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "persistent": self._conn is not None,
+        }
@@ -0,0 +1,308 @@
+"""
+OpenAI 兼容 chat completions 的异步客户端（替代 HttpsApi.draw_sample）
+
+- httpx.AsyncClient 长连接池，复用 TLS 连接
+- 单次请求超时 + 整体 deadline；失败按指数退避（full jitter）有限次重试，
+  只重试网络错误 / 超时 / 429 / 5xx
+- 熔断：连续失败达到阈值后在 reset 时间内直接失败，之后放行一个试探请求
+- 信号量限制并发请求数，上游变慢时不会无限堆积
+
+api_server.py 与 get_llm_response.py 共用。
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+
+import httpx
+
+from config.settings import settings
+
+
+class LLMError(Exception):
+    """LLM 调用失败（重试耗尽、deadline 超时、上游返回不可重试的错误）"""
+
+
+class LLMUnavailable(LLMError):
+    """熔断打开，暂不调用上游"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """closed → (连续失败 threshold 次) → open → (reset_timeout 后) → half-open → 成功则 closed"""
+
+    def __init__(self, threshold=None, reset_timeout=None):
+        self.threshold = threshold or settings.LLM_BREAKER_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.LLM_BREAKER_RESET
+        self._failures = 0
+        self._opened_at = None
+        self._probing = None        # 试探请求开始时间；请求被取消时超过 reset_timeout 再放行下一个
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """是否放行本次请求；half-open 时只放行一个试探请求"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            now = time.monotonic()
+            if state == "half_open" and (
+                self._probing is None or now - self._probing >= self.reset_timeout
+            ):
+                self._probing = now
+                return True
+            return False
+
+    def retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = None
+
+
+class LLMClient:
+
+    RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        host: str = None,
+        key: str = None,
+        model: str = None,
+        timeout: float = None,          # 单次请求超时（秒）
+        deadline: float = None,         # 含重试的整体时限（秒）
+        max_retries: int = None,
+        max_concurrency: int = None,
+        **params,                       # max_tokens / temperature / top_p 等默认参数
+    ):
+        self.host = host or settings.LLM_HOST
+        self.key = key or settings.LLM_API_KEY
+        self.model = model or settings.LLM_MODEL
+        self.timeout = timeout or settings.LLM_TIMEOUT
+        self.deadline = deadline or settings.LLM_DEADLINE
+        self.max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.params = {
+            "max_tokens": settings.LLM_MAX_TOKENS,
+            "temperature": settings.LLM_TEMPERATURE,
+            **params,
+        }
+
+        self.breaker = CircuitBreaker()
+
+        # httpx.AsyncClient / Semaphore 都绑定 event loop，按 loop 懒加载
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    # ------------------------------------------------------------------
+    # 连接池
+    # ------------------------------------------------------------------
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=f"https://{self.host}",
+                headers={
+                    "Authorization": f"Bearer {self.key}",
+                    "User-Agent": "IRAG/1.0",
+                    "Content-Type": "application/json",
+                },
+                timeout=httpx.Timeout(self.timeout, connect=settings.LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ------------------------------------------------------------------
+    # 请求
+    # ------------------------------------------------------------------
+    def _payload(self, messages, params):
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages.strip()}]
+        payload = {"model": self.model, "messages": messages, **self.params, **params}
+        return {k: v for k, v in payload.items() if v is not None}
+
+    async def _acquire(self, remaining):
+        """在 remaining 秒内拿到并发名额，否则抛 LLMError（调用方不记熔断失败）"""
+        try:
+            async with asyncio.timeout(remaining):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            raise LLMError("LLM concurrency queue timed out") from None
+
+    def _backoff(self, attempt):
+        # full jitter：[0, base * 2^attempt)
+        return random.uniform(0, settings.LLM_BACKOFF_BASE * (2 ** attempt))
+
+    async def chat(self, messages, deadline: float = None, **params) -> str:
+        """
+        messages: str 或 OpenAI 格式的 messages 列表
+        deadline: 本次调用（含排队与重试）的时限，默认 settings.LLM_DEADLINE
+        返回回答文本；失败抛 LLMError / LLMUnavailable
+        """
+        if not self.breaker.allow():
+            raise LLMUnavailable("LLM circuit breaker is open", retry_after=self.breaker.retry_after())
+
+        client = self._ensure_client()
+        payload = self._payload(messages, params)
+        end = time.monotonic() + (deadline or self.deadline)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+
+            # 本地并发排队超时不是上游故障，直接失败，不计入熔断
+            await self._acquire(remaining)
+
+            try:
+                remaining = max(end - time.monotonic(), 0.001)
+                try:
+                    async with asyncio.timeout(remaining):
+                        res = await client.post(
+                            "/v1/chat/completions",
+                            json=payload,
+                            timeout=min(self.timeout, remaining),
+                        )
+                finally:
+                    self._semaphore.release()
+                if res.status_code == 200:
+                    content = res.json()["choices"][0]["message"]["content"]
+                    self.breaker.record_success()
+                    return content
+
+                last_error = LLMError(f"LLM API returned {res.status_code}: {res.text[:200]}")
+                if res.status_code not in self.RETRY_STATUS:
+                    # 参数 / 鉴权错误，重试没有意义；上游本身可用，不计入熔断
+                    self.breaker.record_success()
+                    raise last_error
+
+            except (httpx.TransportError, TimeoutError, KeyError, ValueError) as e:
+                last_error = LLMError(f"LLM API call failed: {e!r}")
+
+            if attempt < self.max_retries:
+                delay = min(self._backoff(attempt), max(0.0, end - time.monotonic()))
+                print(f"⚠️ LLM 调用失败，{delay:.2f}s 后重试（{attempt + 1}/{self.max_retries}）: {last_error}")
+                await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error or LLMError("LLM deadline exceeded")
+
+    async def stream_chat(self, messages, deadline: float = None, **params):
+        """
+        流式版本（stream=True），逐段 yield 回答文本。
+        deadline 只约束到第一个 token 为止（含排队与重试）；开始输出后
+        由单次读超时（LLM_TIMEOUT）兜底，已经输出过内容的请求不再重试。
+        """
+        if not self.breaker.allow():
+            raise LLMUnavailable("LLM circuit breaker is open", retry_after=self.breaker.retry_after())
+
+        client = self._ensure_client()
+        payload = self._payload(messages, {**params, "stream": True})
+        end = time.monotonic() + (deadline or self.deadline)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+
+            # 本地并发排队超时不是上游故障，直接失败，不计入熔断
+            await self._acquire(remaining)
+
+            started = False
+            try:
+                async with client.stream(
+                    "POST",
+                    "/v1/chat/completions",
+                    json=payload,
+                    timeout=min(self.timeout, remaining),
+                ) as res:
+                    if res.status_code == 200:
+                        async for line in res.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                break
+                            choices = json.loads(data).get("choices") or []
+                            delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                            if delta:
+                                if not started:
+                                    started = True
+                                    self.breaker.record_success()
+                                yield delta
+                        self.breaker.record_success()
+                        return
+
+                    body = (await res.aread()).decode("utf-8", "replace")
+                    last_error = LLMError(f"LLM API returned {res.status_code}: {body[:200]}")
+                    if res.status_code not in self.RETRY_STATUS:
+                        self.breaker.record_success()
+                        raise last_error
+
+            except (httpx.TransportError, ValueError) as e:
+                if started:
+                    raise LLMError(f"LLM stream interrupted: {e!r}")
+                last_error = LLMError(f"LLM API call failed: {e!r}")
+            finally:
+                self._semaphore.release()
+
+            if attempt < self.max_retries:
+                delay = min(self._backoff(attempt), max(0.0, end - time.monotonic()))
+                print(f"⚠️ LLM 调用失败，{delay:.2f}s 后重试（{attempt + 1}/{self.max_retries}）: {last_error}")
+                await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error or LLMError("LLM deadline exceeded")
+
+    def chat_sync(self, messages, deadline: float = None, **params) -> str:
+        """脚本 / 离线场景的同步调用（每次调用使用独立的 event loop）"""
+        async def _run():
+            try:
+                return await self.chat(messages, deadline=deadline, **params)
+            finally:
+                await self.aclose()
+        return asyncio.run(_run())
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.state,
+            "max_concurrency": self.max_concurrency,
+        }
@@ -0,0 +1,77 @@
+"""
+启动状态与预热
+
+starting → loading（后台加载模型、连接 Milvus）→ warming（预热查询）→ ready
+任一步出错 → failed
+
+- /healthz：进程存活即 200，failed 时 503（交给编排系统重启）
+- /readyz：只有 ready 才 200，滚动发布时流量不会打到冷 worker
+
+预热跑一遍真实链路：bge-m3 / TAPAS / reranker 的首次推理（tokenizer、CUDA 初始化）、
+AsyncMilvusClient 与 ORM 两条 gRPC 连接、BM25 索引加载；可选再调用一次 LLM 建立 TLS 连接。
+预热必须在 worker 进程里跑：preload 模式下 master 里做推理会让 fork 后的 OpenMP 线程池卡死。
+"""
+
+import asyncio
+import time
+
+
+class Readiness:
+
+    def __init__(self):
+        self.state = "starting"
+        self.error = None
+        self.started_at = time.monotonic()
+        self.timings = {}       # 阶段 → 耗时（秒）
+        self._mark = self.started_at
+
+    def set(self, state):
+        now = time.monotonic()
+        self.timings[self.state] = round(now - self._mark, 3)
+        self._mark = now
+        self.state = state
+        print(f"🚦 服务状态: {state}（已启动 {now - self.started_at:.1f}s）")
+
+    def fail(self, error):
+        self.error = repr(error)
+        self.set("failed")
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def alive(self):
+        return self.state != "failed"
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+            "timings": dict(self.timings),
+        }
+
+
+async def warmup(rag, queries, llm_client=None, top_k=3):
+    """用 queries 跑一遍检索的每个阶段；预热写入的检索结果缓存随后清空"""
+    if not queries:
+        return
+
+    # 1) 异步路径：aretrieve（推理线程池 + AsyncMilvusClient + BM25 + rerank）
+    for q in queries:
+        await rag.aretrieve(q, top_k=top_k)
+    rag.result_cache.clear()
+
+    # 2) 同步 / 批量路径：批量 embedding、pymilvus ORM 多向量搜索、批量 rerank
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, rag.retrieve_batch, list(queries), top_k)
+    rag.result_cache.clear()
+
+    # 3) 可选：LLM 连接池（会产生一次极短的计费调用）
+    if llm_client is not None:
+        try:
+            await llm_client.chat(queries[0], max_tokens=1)
+        except Exception as e:
+            # LLM 不可用不影响检索接口，只记录
+            print(f"⚠️ LLM 预热失败: {e}")
@@ -0,0 +1,183 @@
+"""
+语义答案缓存：近义问题直接复用已生成的回答
+
+- 问题向量（bge-m3，与检索共用同一次推理）归一化后存进内存矩阵，
+  查询时做一次矩阵乘法取最相似的条目；缓存规模在几千条以内，
+  精确的内积检索比引入 ANN 库更简单，延迟也在亚毫秒级
+- 命中条件：同一 mode / top_k，余弦相似度 ≥ threshold，未过期
+- 有效性：条目记录写入时的索引版本号；版本变化后，只有被引用的 chunk
+  仍全部存在于当前索引时才继续使用（并刷新版本号），否则淘汰
+- 淘汰：TTL + 条目数上限（按最近命中时间 LRU）
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from config.settings import settings
+from storage.index_version import read_index_version
+
+
+class SemanticCache:
+
+    def __init__(self, threshold=None, maxsize=None, ttl=None, id_checker=None):
+        """
+        id_checker: callable(ids) -> 仍存在于索引中的 id 集合
+                    （通常是 MilvusVectorStore.existing_ids），为 None 时版本变化即失效
+        """
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.maxsize = settings.SEMANTIC_CACHE_SIZE if maxsize is None else maxsize
+        self.ttl = settings.SEMANTIC_CACHE_TTL if ttl is None else ttl
+        self.id_checker = id_checker
+
+        self._vectors = None      # float32[N, dim]，已归一化
+        self._entries = []        # 与 _vectors 行一一对应
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    @staticmethod
+    def _normalize(vec):
+        vec = np.asarray(vec, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _expired(self, entry, now):
+        return bool(self.ttl) and now - entry["created_at"] > self.ttl
+
+    def _remove(self, rows):
+        rows = set(rows)
+        keep = [i for i in range(len(self._entries)) if i not in rows]
+        self._entries = [self._entries[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep else None
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def lookup(self, vector, mode, top_k):
+        """
+        返回 {"answer", "refs", "similarity"} 或 None。
+        版本变化时可能调用 id_checker（访问 Milvus），请勿在 event loop 线程里直接调用。
+        """
+        if not self.enabled:
+            return None
+
+        q = self._normalize(vector)
+        now = time.time()
+
+        with self._lock:
+            if self._vectors is None:
+                self.misses += 1
+                return None
+
+            expired = [i for i, e in enumerate(self._entries) if self._expired(e, now)]
+            if expired:
+                self._remove(expired)
+                if self._vectors is None:
+                    self.misses += 1
+                    return None
+
+            sims = self._vectors @ q
+            best = None
+            for i in np.argsort(-sims):
+                if sims[i] < self.threshold:
+                    break
+                e = self._entries[i]
+                if e["mode"] == mode and e["top_k"] == top_k:
+                    best = i
+                    break
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best]
+            similarity = float(sims[best])
+
+        if not self._still_valid(entry):
+            with self._lock:
+                rows = [i for i, e in enumerate(self._entries) if e is entry]
+                if rows:
+                    self._remove(rows)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            entry["last_hit"] = now
+            self.hits += 1
+
+        return {"answer": entry["answer"], "refs": entry["refs"], "similarity": round(similarity, 4)}
+
+    def _still_valid(self, entry):
+        version = read_index_version()
+        if entry["index_version"] == version:
+            return True
+        if self.id_checker is None or not entry["chunk_ids"]:
+            return False
+
+        try:
+            alive = self.id_checker(entry["chunk_ids"])
+        except Exception as e:
+            print(f"⚠️ 语义缓存校验引用 chunk 失败: {e}")
+            return False
+
+        if set(entry["chunk_ids"]) <= set(alive):
+            entry["index_version"] = version
+            return True
+        return False
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def add(self, vector, mode, top_k, answer, refs, chunk_ids):
+        if not self.enabled or not answer:
+            return
+
+        now = time.time()
+        entry = {
+            "mode": mode,
+            "top_k": top_k,
+            "answer": answer,
+            "refs": refs,
+            "chunk_ids": [c for c in chunk_ids if c is not None],
+            "index_version": read_index_version(),
+            "created_at": now,
+            "last_hit": now,
+        }
+        q = self._normalize(vector)[None, :]
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = q
+            else:
+                self._vectors = np.vstack([self._vectors, q])
+            self._entries.append(entry)
+
+            if len(self._entries) > self.maxsize:
+                # 淘汰最久未命中的条目
+                order = sorted(range(len(self._entries)), key=lambda i: self._entries[i]["last_hit"])
+                self._remove(order[:len(self._entries) - self.maxsize])
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
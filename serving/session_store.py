@@ -0,0 +1,211 @@
+"""
+服务端会话：客户端只发 session_id + 新问题，不再每轮回传完整 history
+
+每个会话保存最近 max_turns 轮：
+    question / answer —— 用于拼接多轮 messages
+    q_vec             —— 该轮问题的 bge-m3 向量（float32），后续轮次直接复用
+    chunk_ids         —— 该轮检索到的 chunk id
+多轮检索向量 = 当前问题向量 + 最近几轮问题向量按 decay 衰减加权后归一化，
+每轮只 embedding 新问题本身，不再把最近几轮问题拼起来重新推理。
+
+存储用 SQLite（多个 worker 共享同一文件；path 为空时用进程内 :memory:），
+TTL + 会话数上限 + 每会话轮数上限，占用有界。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from config.settings import settings
+
+
+def combine_turn_vectors(current, previous, decay=None):
+    """
+    current:  当前问题向量
+    previous: 之前各轮问题向量（从旧到新），None 会被跳过
+    返回归一化后的加权和：当前轮权重 1，往前每一轮乘以 decay
+    """
+    decay = settings.SESSION_DECAY if decay is None else decay
+
+    def _unit(v):
+        v = np.asarray(v, dtype="float32").reshape(-1)
+        n = np.linalg.norm(v)
+        return v / n if n > 0 else v
+
+    combined = _unit(current)
+    weight = 1.0
+    for vec in reversed([v for v in previous if v is not None]):
+        weight *= decay
+        if weight <= 0:
+            break
+        combined = combined + weight * _unit(vec)
+    return _unit(combined)
+
+
+class SessionStore:
+
+    def __init__(self, path: str = None, ttl: float = None, max_sessions: int = None, max_turns: int = None):
+        self.path = settings.SESSION_DB if path is None else path
+        self.ttl = settings.SESSION_TTL if ttl is None else ttl
+        self.max_sessions = settings.SESSION_MAX if max_sessions is None else max_sessions
+        self.max_turns = settings.SESSION_MAX_TURNS if max_turns is None else max_turns
+
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.created = 0
+        self.expired = 0
+
+        if self.path:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path or ":memory:", check_same_thread=False, timeout=5)
+        if self.path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " session_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " question TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " q_vec BLOB,"
+            " chunk_ids TEXT NOT NULL DEFAULT '[]',"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, seq)"
+            ")"
+        )
+        # 早期建的库没有 chunk_ids 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(turns)")}
+        if "chunk_ids" not in columns:
+            self._conn.execute("ALTER TABLE turns ADD COLUMN chunk_ids TEXT NOT NULL DEFAULT '[]'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        self._conn.commit()
+
+    def reopen(self):
+        """fork 之后在子进程中调用：SQLite 连接不能跨进程共享"""
+        self._lock = threading.Lock()
+        self._connect()
+
+    # ------------------------------------------------------------------
+    # 会话
+    # ------------------------------------------------------------------
+    def create(self):
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+                (session_id, now, now),
+            )
+            self._maybe_purge(now)
+            self._conn.commit()
+            self.created += 1
+        return session_id
+
+    def delete(self, session_id):
+        with self._lock:
+            n = self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+        return n > 0
+
+    def load(self, session_id):
+        """
+        返回最近 max_turns 轮（从旧到新）：
+            [{"question", "answer", "q_vec", "chunk_ids"}]
+        会话不存在或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[0] > self.ttl:
+                self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+                self.expired += 1
+                return None
+
+            rows = self._conn.execute(
+                "SELECT question, answer, q_vec, chunk_ids FROM turns"
+                " WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, self.max_turns),
+            ).fetchall()
+
+        return [
+            {
+                "question": question,
+                "answer": answer,
+                "q_vec": np.frombuffer(q_vec, dtype="float32") if q_vec else None,
+                "chunk_ids": json.loads(chunk_ids),
+            }
+            for question, answer, q_vec, chunk_ids in reversed(rows)
+        ]
+
+    def append(self, session_id, question, answer, q_vec=None, chunk_ids=None):
+        now = time.time()
+        blob = np.asarray(q_vec, dtype="float32").reshape(-1).tobytes() if q_vec is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO turns (session_id, seq, question, answer, q_vec, chunk_ids, created_at)"
+                " SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?, ?, ? FROM turns WHERE session_id = ?",
+                (session_id, question, answer, blob, json.dumps(chunk_ids or []), now, session_id),
+            )
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+            # 只保留最近 max_turns 轮
+            self._conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND seq <= ("
+                " SELECT MAX(seq) FROM turns WHERE session_id = ?) - ?",
+                (session_id, session_id, self.max_turns),
+            )
+            self._maybe_purge(now)
+            self._conn.commit()
+
+    def _maybe_purge(self, now):
+        """过期 / 超出会话数上限的清理每 100 次写入做一次（调用方持有锁）"""
+        self._writes += 1
+        if self._writes % 100 != 1:
+            return
+        if self.ttl:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+        if self.max_sessions:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE id IN ("
+                " SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_sessions,),
+            )
+        self._conn.execute("DELETE FROM turns WHERE session_id NOT IN (SELECT id FROM sessions)")
+
+    def stats(self):
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            turns = self._conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+        return {
+            "sessions": sessions,
+            "turns": turns,
+            "max_sessions": self.max_sessions,
+            "max_turns": self.max_turns,
+            "ttl": self.ttl,
+            "created": self.created,
+            "expired": self.expired,
+            "persistent": bool(self.path),
+        }
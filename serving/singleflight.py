@@ -0,0 +1,45 @@
+"""
+Singleflight：相同 key 的并发请求只计算一次
+
+热门问题同时涌入时，第一个请求（leader）真正执行检索 + LLM，
+其余请求（follower）等待同一个结果，避免对模型和付费 LLM API 的惊群。
+计算放在独立的 task 里执行：leader 的客户端断开不会连累正在等待的 follower。
+"""
+
+import asyncio
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._inflight = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        fn: 无参协程函数。返回 (result, shared)，shared 表示结果来自他人发起的计算
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        self.leaders += 1
+
+        def _done(t):
+            self._inflight.pop(key, None)
+            if not t.cancelled():
+                t.exception()   # 标记异常已读取，所有等待者都已拿到
+
+        task.add_done_callback(_done)
+        return await asyncio.shield(task), False
+
+    def stats(self):
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
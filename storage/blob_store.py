@@ -0,0 +1,112 @@
+"""
+表格 payload 外部存储（content-addressed）
+
+- 表格 JSON → zlib 压缩后的原始字节，存入本地 SQLite 文件
+- key = sha256(压缩字节)，Milvus 行中只保存这个 digest
+- 读取时按 digest 懒加载，并经过进程内 LRU 缓存
+
+这样表格大小不再受 Milvus VARCHAR(65535) 限制，
+也不会因为 base64 在每次 search 的 payload 中膨胀 33%。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+
+from config.settings import settings
+
+
+class TableBlobStore:
+
+    def __init__(self, path: str = None, cache_size: int = None):
+        self.path = path or settings.TABLE_BLOB_DB
+        self.cache_size = cache_size if cache_size is not None else settings.TABLE_BLOB_CACHE_SIZE
+
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+
+        # 同一个连接会被 API 的多个线程使用，写操作用锁串行化
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " digest TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL"
+            ")"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+        self._cache = OrderedDict()
+
+    def reopen(self):
+        """fork 之后在子进程中调用：SQLite 连接不能跨进程共享"""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 原始字节
+    # ------------------------------------------------------------------
+    def put(self, data: bytes) -> str:
+        """写入压缩字节，返回 digest（已存在则直接复用）"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)",
+                (digest, sqlite3.Binary(data)),
+            )
+            self._conn.commit()
+        return digest
+
+    def get(self, digest: str):
+        """按 digest 读取压缩字节，不存在返回 None"""
+        if not digest:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def __contains__(self, digest):
+        return self.get(digest) is not None
+
+    # ------------------------------------------------------------------
+    # 表格 JSON
+    # ------------------------------------------------------------------
+    def put_table(self, table: dict) -> str:
+        """表格 JSON → zlib → 写入，返回 digest；空表返回空串"""
+        if not table:
+            return ""
+        raw = json.dumps(table, ensure_ascii=False).encode("utf-8")
+        return self.put(zlib.compress(raw))
+
+    def get_table(self, digest: str) -> dict:
+        """按 digest 懒加载表格 JSON（带 LRU 缓存）"""
+        if not digest:
+            return {}
+
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+
+        data = self.get(digest)
+        if data is None:
+            print(f"⚠️ 表格 blob 不存在: {digest}")
+            return {}
+
+        table = json.loads(zlib.decompress(data).decode("utf-8"))
+
+        with self._lock:
+            self._cache[digest] = table
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return table
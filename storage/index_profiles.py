@@ -0,0 +1,105 @@
+"""
+Milvus 索引 profile
+
+每个 profile 包含：
+- index：建索引参数（index_type + params）
+- search：默认的查询参数（ef / nprobe / search_list ...）
+
+通过 settings.MILVUS_INDEX_TYPE 选择 profile，
+查询时也可以按次覆盖 search 参数（例如调大 ef 换召回）。
+用 scripts/bench_index.py 在真实 collection 上比较各 profile 的
+recall@k / p50 / p99 延迟 / 索引内存，再决定取舍。
+"""
+
+import copy
+
+METRIC_TYPE = "COSINE"
+
+INDEX_PROFILES = {
+    # 精确检索，作为 benchmark 的基线
+    "FLAT": {
+        "index": {"index_type": "FLAT", "params": {}},
+        "search": {},
+    },
+    # 当前线上默认：与旧版硬编码参数一致
+    "HNSW": {
+        "index": {"index_type": "HNSW", "params": {"M": 8, "efConstruction": 64}},
+        "search": {"ef": 64},
+    },
+    # HNSW + 标量量化，内存约为 float32 的 1/4
+    "HNSW_SQ": {
+        "index": {
+            "index_type": "HNSW_SQ",
+            "params": {"M": 8, "efConstruction": 64, "sq_type": "SQ8"},
+        },
+        "search": {"ef": 64},
+    },
+    # HNSW + 乘积量化，m 需要整除向量维度（1024 / 768 均可被 16 整除）
+    "HNSW_PQ": {
+        "index": {
+            "index_type": "HNSW_PQ",
+            "params": {"M": 8, "efConstruction": 64, "m": 16, "nbits": 8},
+        },
+        "search": {"ef": 64},
+    },
+    "IVF_PQ": {
+        "index": {"index_type": "IVF_PQ", "params": {"nlist": 256, "m": 16, "nbits": 8}},
+        "search": {"nprobe": 16},
+    },
+    # 磁盘索引，适合内存紧张的节点
+    "DISKANN": {
+        "index": {"index_type": "DISKANN", "params": {}},
+        "search": {"search_list": 100},
+    },
+}
+
+
+def get_profile(name: str) -> dict:
+    """按名称取 profile（大小写不敏感），未知名称直接报错"""
+    key = (name or "").upper()
+    if key not in INDEX_PROFILES:
+        raise ValueError(
+            f"Unknown index profile: {name}. "
+            f"Available: {', '.join(INDEX_PROFILES)}"
+        )
+    return INDEX_PROFILES[key]
+
+
+def build_index_params(name: str) -> dict:
+    """生成 create_index 用的参数"""
+    profile = get_profile(name)
+    params = copy.deepcopy(profile["index"])
+    params["metric_type"] = METRIC_TYPE
+    return params
+
+
+def build_search_params(name: str, overrides: dict = None, limit: int = None) -> dict:
+    """生成 search 用的参数；overrides 可按次覆盖 ef / nprobe 等"""
+    profile = get_profile(name)
+    params = dict(profile["search"])
+    if overrides:
+        params.update(overrides)
+
+    # HNSW 系列要求 ef >= limit，DISKANN 要求 search_list >= limit
+    if limit is not None:
+        for key in ("ef", "search_list"):
+            if key in params:
+                params[key] = max(params[key], limit)
+
+    # IVF 系列要求 nprobe <= nlist（覆盖参数可能给得过大）
+    nlist = profile["index"]["params"].get("nlist")
+    if nlist and "nprobe" in params:
+        params["nprobe"] = min(params["nprobe"], nlist)
+
+    return {"metric_type": METRIC_TYPE, "params": params}
+
+
+def detect_profile(collection, field_name: str):
+    """从已存在 collection 的索引反推 profile 名称，未识别返回 None"""
+    for index in collection.indexes:
+        if index.field_name != field_name:
+            continue
+        index_type = (index.params or {}).get("index_type", "").upper()
+        if index_type in INDEX_PROFILES:
+            return index_type
+    return None
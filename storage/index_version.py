@@ -0,0 +1,57 @@
+"""
+索引版本号
+
+每次索引写入提交（insert / delete / replace / alias 切换 / 快照导入）后 +1，
+检索结果缓存等把它作为 key 的一部分，版本变化即自动失效。
+
+版本号存在本地 JSON 文件里，索引进程和 API 进程共享；
+读取时只做一次 stat，mtime 不变就直接用内存中的值。
+"""
+
+import json
+import os
+import threading
+import time
+
+from config.settings import settings
+
+_lock = threading.Lock()
+_cached = {"mtime": None, "version": 0}
+
+
+def read_index_version(path: str = None) -> int:
+    path = path or settings.INDEX_VERSION_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+    with _lock:
+        if _cached["mtime"] == mtime:
+            return _cached["version"]
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            version = int(json.load(f).get("version", 0))
+    except (OSError, ValueError):
+        # 写入中途被读到，沿用上一次的值
+        return _cached["version"]
+
+    with _lock:
+        _cached["mtime"] = mtime
+        _cached["version"] = version
+    return version
+
+
+def bump_index_version(path: str = None) -> int:
+    path = path or settings.INDEX_VERSION_PATH
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+    version = read_index_version(path) + 1
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(tmp, path)
+    return version
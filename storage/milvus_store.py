@@ -142,10 +142,23 @@
 
 from pymilvus import (
     connections, FieldSchema, CollectionSchema,
-    DataType, Collection, utility
+    DataType, Collection, utility, BulkInsertState, AsyncMilvusClient
 )
 from config.settings import settings
+from storage.index_profiles import build_index_params, build_search_params, detect_profile
+from storage.index_version import bump_index_version
 import numpy as np
+import json
+import math
+import os
+import re
+import time
+
+# 检索结果需要带回的字段
+SEARCH_OUTPUT_FIELDS = ["text", "table_digest", "modality", "metadata"]
+
+# 过滤条件的 key 会拼进表达式，只允许字母 / 数字 / 下划线
+FILTER_KEY_RE = re.compile(r"[A-Za-z0-9_]+")
 
 class MilvusVectorStore:
     """
@@ -153,13 +166,19 @@ class MilvusVectorStore:
     支持：
     - 文本向量 bge-m3
     - 表格向量 TAPAS
+    - 线性化表格的 bge-m3 向量（table_text_vector，查询时与文本共用一个 query 向量）
+
+    默认读写 settings.MILVUS_ALIAS（蓝绿重建时它是指向
+    最新版本 collection 的 alias，也兼容同名的旧 collection）。
     """
 
 
-    def __init__(self):
-        self.collection_name = "IRAG_MM"
+    def __init__(self, index_profile: str = None, collection_name: str = None):
+        self.collection_name = collection_name or settings.MILVUS_ALIAS
         self.text_dim = 1024
         self.table_dim = 768
+        self.index_profile = index_profile or settings.MILVUS_INDEX_TYPE
+        self._async_client = None
 
         connections.connect(
             alias="default",
@@ -170,8 +189,49 @@ class MilvusVectorStore:
         if not utility.has_collection(self.collection_name):
             self._create_collection()
 
+        self._configured_profile = self.index_profile
         self.collection = Collection(self.collection_name)
         self.collection.load()
+        self._inspect_collection()
+
+
+    def _inspect_collection(self):
+        # 旧版 collection 没有 table_text_vector，需蓝绿重建后才能用 TABLE_QUERY_MODE=text
+        self.has_table_text = any(
+            f.name == "table_text_vector" for f in self.collection.schema.fields
+        )
+
+        # 已有 collection 以实际建好的索引为准，保证查询参数匹配
+        self.index_profile = self._configured_profile
+        existing = detect_profile(self.collection, "text_vector")
+        if existing and existing != self.index_profile.upper():
+            print(f"[Milvus] Collection index is {existing}, "
+                  f"ignoring configured profile {self.index_profile}.")
+            self.index_profile = existing
+
+    def refresh(self):
+        """
+        索引版本变化后调用：alias 可能已被 promote 切到另一个版本的 collection，
+        重新读取 schema（has_table_text）和实际索引类型（index_profile）
+        """
+        self.collection = Collection(self.collection_name)
+        self.collection.load()
+        self._inspect_collection()
+
+
+    def reconnect(self):
+        """
+        fork 之后在子进程中调用（gunicorn post_fork）：
+        gRPC channel 不能跨进程复用，需断开继承来的连接后重新建立
+        """
+        connections.disconnect("default")
+        connections.connect(
+            alias="default",
+            host=settings.MILVUS_HOST,
+            port=settings.MILVUS_PORT,
+        )
+        self.collection = Collection(self.collection_name)
+        self._async_client = None
 
 
     # ------------------------------------------------------------------
@@ -198,10 +258,21 @@ class MilvusVectorStore:
                 description="Table embedding (TAPAS)"
             ),
 
+            FieldSchema(
+                name="table_text_vector",
+                dtype=DataType.FLOAT_VECTOR,
+                dim=self.text_dim,
+                description="Linearized table embedding (BGE-M3)"
+            ),
+
             FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
             #FieldSchema(name="table_json", dtype=DataType.JSON),
-            FieldSchema(name="table_blob",dtype=DataType.VARCHAR,max_length=65535), # to store table as string
+            # 表格 payload 存在外部 TableBlobStore，这里只保存 sha256 digest
+            FieldSchema(name="table_digest", dtype=DataType.VARCHAR, max_length=64),
             FieldSchema(name="modality", dtype=DataType.VARCHAR, max_length=32),
+            # 文档级字段：按 source 删除 / 替换 / 统计
+            FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=1024),
+            FieldSchema(name="doc_hash", dtype=DataType.VARCHAR, max_length=64),
             FieldSchema(name="metadata", dtype=DataType.JSON)
         ]
 
@@ -212,19 +283,30 @@ class MilvusVectorStore:
 
         collection = Collection(self.collection_name, schema)
 
-        # 为两个向量字段分别创建索引
-        index_params = {
-            "index_type": "HNSW",
-            "metric_type": "COSINE",
-            "params": {"M": 8, "efConstruction": 64}
-        }
+        # 为各个向量字段分别创建索引（参数来自 index profile）
+        index_params = build_index_params(self.index_profile)
 
         collection.create_index("text_vector", index_params)
         collection.create_index("table_vector", index_params)
+        collection.create_index("table_text_vector", index_params)
+        collection.create_index("doc_id", {"index_type": "INVERTED"})
+
+        print(f"[Milvus] Multi-vector collection created ({self.index_profile}).")
+
+    # ------------------------------------------------------------------
+    # 索引版本：只有写入正在服务的 collection 才需要让各级缓存失效
+    # ------------------------------------------------------------------
+    def is_live(self):
+        """当前 collection 是否正在服务查询（就是 alias 本身，或 alias 指向它）"""
+        alias = settings.MILVUS_ALIAS
+        return self.collection_name == alias or self.resolve_alias(alias) == self.collection_name
 
-        print("[Milvus] Multi-vector collection created.")
+    def bump_if_live(self):
+        # 蓝绿重建写的是尚未上线的版本，缓存不受影响，只在 promote() 时 bump 一次
+        if self.is_live():
+            bump_index_version()
 
-    def add_records(self, records):
+    def add_records(self, records, bump: bool = True):
         """
         接收结构化 records，然后写入 Milvus（行模式）。
         每条记录是一行。
@@ -285,10 +367,14 @@ class MilvusVectorStore:
                 "table_vector": ttv,
                 "text": r.get("text") or "",
                 #"table_json": r.get("table_json") or {},
-                "table_blob": r.get("table_blob") or "",
+                "table_digest": r.get("table_digest") or "",
                 "modality": r.get("modality") or "",
+                "doc_id": r.get("doc_id") or "",
+                "doc_hash": r.get("doc_hash") or "",
                 "metadata": r.get("metadata") or {},
             }
+            if self.has_table_text:
+                row["table_text_vector"] = sanitize_vec(r.get("table_text_vec"), text_dim)
             rows.append(row)
 
         # --------------------------------------------------
@@ -305,20 +391,369 @@ class MilvusVectorStore:
         # --------------------------------------------------
         # 最终插入——行模式
         # --------------------------------------------------
-        self.collection.insert(rows)
+        result = self.collection.insert(rows)
+        self.collection.flush()
+        if bump:
+            self.bump_if_live()
+        return list(result.primary_keys)
+
+    # ------------------------------------------------------------------
+    # 文档级操作（基于 doc_id 标量索引）
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _doc_expr(doc_id):
+        # json.dumps 负责转义引号 / 反斜杠
+        return f"doc_id == {json.dumps(doc_id, ensure_ascii=False)}"
+
+    def has_source(self, doc_id):
+        """该文档是否有已索引的行"""
+        return bool(self.collection.query(expr=self._doc_expr(doc_id), output_fields=["id"], limit=1))
+
+    def delete_source(self, doc_id):
+        """删除某个文档的全部行，返回删除条数"""
+        result = self.collection.delete(expr=self._doc_expr(doc_id))
+        self.collection.flush()
+        self.bump_if_live()
+        return result.delete_count
+
+    def replace_source(self, doc_id, records):
+        """
+        用新的 records 替换某个文档的全部行。
+        Milvus 没有事务：这里先插入新行，再删除该文档下除新主键外的旧行，
+        读者在切换瞬间最多看到新旧并存，而不会看到文档缺失。
+        """
+        for r in records:
+            r["doc_id"] = doc_id
+
+        new_ids = self.add_records(records, bump=False) or []
+
+        expr = self._doc_expr(doc_id)
+        if new_ids:
+            expr += f" and id not in {json.dumps(new_ids)}"
+
+        result = self.collection.delete(expr=expr)
         self.collection.flush()
+        self.bump_if_live()
+        print(f"[Milvus] Replaced {doc_id}: +{len(new_ids)} / -{result.delete_count}")
+        return len(new_ids), result.delete_count
+
+    # ------------------------------------------------------------------
+    # 蓝绿重建：版本化 collection + alias 切换
+    # ------------------------------------------------------------------
+    @classmethod
+    def create_version(cls, alias: str = None, index_profile: str = None):
+        """新建一个版本化 collection（{alias}_vYYYYmmddHHMMSS），返回绑定它的 store"""
+        alias = alias or settings.MILVUS_ALIAS
+        name = f"{alias}_v{time.strftime('%Y%m%d%H%M%S')}"
+        return cls(index_profile=index_profile, collection_name=name)
+
+    @staticmethod
+    def list_versions(alias: str = None):
+        """该 alias 下的所有版本化 collection，按时间从旧到新"""
+        alias = alias or settings.MILVUS_ALIAS
+        prefix = f"{alias}_v"
+        return sorted(c for c in utility.list_collections() if c.startswith(prefix))
+
+    @classmethod
+    def resolve_alias(cls, alias: str = None):
+        """alias 当前指向的版本化 collection，没有则返回 None"""
+        alias = alias or settings.MILVUS_ALIAS
+        for name in cls.list_versions(alias):
+            if alias in utility.list_aliases(name):
+                return name
+        return None
+
+    def promote(self, alias: str = None, drop_legacy: bool = False):
+        """
+        把 alias 原子切换到当前 collection。
+        若存在与 alias 同名的旧（非版本化）collection，需要 drop_legacy=True
+        先删除它才能建 alias——只在第一次迁移时有短暂空窗。
+        """
+        alias = alias or settings.MILVUS_ALIAS
+        if alias == self.collection_name:
+            raise ValueError("Cannot promote a collection onto its own name.")
+
+        live = self.resolve_alias(alias)
+        if live:
+            utility.alter_alias(self.collection_name, alias)
+        else:
+            if utility.has_collection(alias):
+                if not drop_legacy:
+                    raise RuntimeError(
+                        f"Legacy collection `{alias}` blocks the alias. "
+                        f"Re-run with drop_legacy=True to replace it."
+                    )
+                print(f"⚠️ Dropping legacy collection: {alias}")
+                utility.drop_collection(alias)
+            utility.create_alias(self.collection_name, alias)
+
+        bump_index_version()
+        print(f"[Milvus] Alias `{alias}` → {self.collection_name} (was {live})")
+        return live
+
+    @classmethod
+    def gc_versions(cls, alias: str = None, retain: int = None):
+        """只保留最新的 retain 个版本（当前 live 版本永远保留），返回被删除的名字"""
+        alias = alias or settings.MILVUS_ALIAS
+        retain = settings.MILVUS_RETAIN_VERSIONS if retain is None else retain
+
+        versions = cls.list_versions(alias)
+        live = cls.resolve_alias(alias)
+        keep = set(versions[-retain:]) if retain > 0 else set()
+        if live:
+            keep.add(live)
+
+        dropped = []
+        for name in versions:
+            if name not in keep:
+                utility.drop_collection(name)
+                dropped.append(name)
+
+        if dropped:
+            print(f"[Milvus] Garbage-collected versions: {', '.join(dropped)}")
+        return dropped
+
+    def drop(self):
+        """删除当前 collection（用于校验失败的新版本）"""
+        self.collection.release()
+        utility.drop_collection(self.collection_name)
+
+    def existing_ids(self, ids):
+        """返回 ids 中仍存在于 collection 的主键集合"""
+        ids = [int(i) for i in ids if i is not None]
+        if not ids:
+            return set()
+        rows = self.collection.query(expr=f"id in {ids}", output_fields=["id"])
+        return {r["id"] for r in rows}
+
+    def list_sources(self):
+        """
+        列出已索引的文档：
+            [{"doc_id": ..., "doc_hash": ..., "rows": n}, ...]
+        """
+        stats = {}
+        for row in self.iter_rows(["doc_id", "doc_hash"], expr='doc_id != ""'):
+            entry = stats.setdefault(row["doc_id"], {
+                "doc_id": row["doc_id"],
+                "doc_hash": row["doc_hash"],
+                "rows": 0,
+            })
+            entry["rows"] += 1
+
+        return sorted(stats.values(), key=lambda x: x["doc_id"])
+
+    def iter_rows(self, output_fields, expr="id >= 0", batch_size=1000):
+        """流式遍历整个 collection（query_iterator 封装）"""
+        it = self.collection.query_iterator(
+            batch_size=batch_size,
+            expr=expr,
+            output_fields=output_fields,
+        )
+        while True:
+            batch = it.next()
+            if not batch:
+                it.close()
+                break
+            yield from batch
+
+    # ------------------------------------------------------------------
+    # 快照：导出 / 导入 Parquet
+    # ------------------------------------------------------------------
+    def _data_fields(self):
+        """除 auto_id 主键外的全部字段"""
+        return [f for f in self.collection.schema.fields if not f.is_primary]
+
+    def export_parquet(self, out_dir, rows_per_file=10000, blob_store=None):
+        """
+        把 collection 流式导出为分块 Parquet：
+        - 向量 → fixed_size_list<float32>[dim]
+        - VARCHAR → string，JSON → JSON 字符串
+        - blob_store 不为空时，被引用的表格 payload 一并导出到 tables.parquet
+        另写 manifest.json 记录字段、维度与行数。
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(out_dir, exist_ok=True)
+        fields = self._data_fields()
+
+        def _arrow_type(f):
+            if f.dtype == DataType.FLOAT_VECTOR:
+                return pa.list_(pa.float32(), f.params["dim"])
+            if f.dtype == DataType.INT64:
+                return pa.int64()
+            return pa.string()
+
+        schema = pa.schema([(f.name, _arrow_type(f)) for f in fields])
+        json_fields = {f.name for f in fields if f.dtype == DataType.JSON}
+
+        files = []
+        digests = set()
+        buffer = []
+        total = 0
+
+        def _flush():
+            name = f"part-{len(files):05d}.parquet"
+            columns = {}
+            for f in fields:
+                values = [r.get(f.name) for r in buffer]
+                if f.name in json_fields:
+                    values = [json.dumps(v or {}, ensure_ascii=False) for v in values]
+                columns[f.name] = values
+            pq.write_table(pa.Table.from_pydict(columns, schema=schema), os.path.join(out_dir, name))
+            files.append(name)
+
+        for row in self.iter_rows([f.name for f in fields]):
+            buffer.append(row)
+            if row.get("table_digest"):
+                digests.add(row["table_digest"])
+            if len(buffer) >= rows_per_file:
+                _flush()
+                total += len(buffer)
+                buffer = []
+
+        if buffer:
+            _flush()
+            total += len(buffer)
+
+        tables = 0
+        if blob_store is not None and digests:
+            kept = [(d, blob_store.get(d)) for d in sorted(digests)]
+            kept = [(d, b) for d, b in kept if b is not None]
+            pq.write_table(
+                pa.Table.from_pydict(
+                    {"digest": [d for d, _ in kept], "data": [b for _, b in kept]},
+                    schema=pa.schema([("digest", pa.string()), ("data", pa.binary())]),
+                ),
+                os.path.join(out_dir, "tables.parquet"),
+            )
+            tables = len(kept)
+
+        manifest = {
+            "collection": self.collection_name,
+            "index_profile": self.index_profile,
+            "rows": total,
+            "tables": tables,
+            "files": files,
+            "fields": [
+                {"name": f.name, "dtype": f.dtype.name, "dim": f.params.get("dim")}
+                for f in fields
+            ],
+        }
+        with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as fp:
+            json.dump(manifest, fp, ensure_ascii=False, indent=2)
+
+        print(f"[Milvus] Exported {total} rows / {tables} tables → {out_dir}")
+        return manifest
+
+    def import_parquet(self, in_dir, remote_prefix=None, blob_store=None, batch_size=1000):
+        """
+        从 export_parquet 的目录导入。
+        - remote_prefix 不为空：part 文件需已拷贝到 Milvus 对象存储的该前缀下，
+          走 do_bulk_insert 批量导入（不经过 SDK 逐行插入）
+        - 否则：本地流式读取 Parquet，按 batch 调用 insert
+        """
+        import pyarrow.parquet as pq
+
+        with open(os.path.join(in_dir, "manifest.json"), encoding="utf-8") as fp:
+            manifest = json.load(fp)
+
+        fields = self._data_fields()
+        expected = [f["name"] for f in manifest["fields"]]
+        actual = [f.name for f in fields]
+        if expected != actual:
+            raise ValueError(f"Snapshot fields {expected} do not match collection fields {actual}")
+
+        # 表格 payload 先落到本地 blob store
+        tables_path = os.path.join(in_dir, "tables.parquet")
+        if blob_store is not None and os.path.exists(tables_path):
+            for batch in pq.ParquetFile(tables_path).iter_batches(batch_size=batch_size):
+                for data in batch.column("data").to_pylist():
+                    blob_store.put(data)
+
+        if remote_prefix:
+            for name in manifest["files"]:
+                task_id = utility.do_bulk_insert(
+                    collection_name=self.collection_name,
+                    files=[f"{remote_prefix.rstrip('/')}/{name}"],
+                )
+                self._wait_bulk_insert(task_id, name)
+        else:
+            json_fields = {f.name for f in fields if f.dtype == DataType.JSON}
+            for name in manifest["files"]:
+                pf = pq.ParquetFile(os.path.join(in_dir, name))
+                for batch in pf.iter_batches(batch_size=batch_size):
+                    rows = batch.to_pylist()
+                    for r in rows:
+                        for k in json_fields:
+                            r[k] = json.loads(r[k] or "{}")
+                    self.collection.insert(rows)
+            self.collection.flush()
+
+        self.bump_if_live()
+        rows = self.collection.num_entities
+        print(f"[Milvus] Imported snapshot {in_dir} → {self.collection_name} ({rows} rows)")
+        return rows
+
+    @staticmethod
+    def _wait_bulk_insert(task_id, name, poll_s=2.0):
+        while True:
+            state = utility.get_bulk_insert_state(task_id)
+            if state.state == BulkInsertState.ImportCompleted:
+                print(f"[Milvus] Bulk insert done: {name} ({state.row_count} rows)")
+                return
+            if state.state in (BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned):
+                raise RuntimeError(f"Bulk insert failed for {name}: {state.failed_reason}")
+            time.sleep(poll_s)
+
+    # ------------------------------------------------------------------
+    # 过滤条件：{"company": "AIA"} → metadata["company"] == "AIA"
+    # doc_id / modality 是标量字段，直接按字段过滤
+    # filters 可能直接来自 HTTP 请求：key 按 FILTER_KEY_RE 校验，值只接受
+    # str / int / float / bool（或它们的非空列表），其余抛 ValueError
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _filter_literal(v):
+        if isinstance(v, bool):
+            return "true" if v else "false"
+        if isinstance(v, (int, float)) and math.isfinite(v):
+            return repr(v)
+        if isinstance(v, str):
+            # json.dumps 负责转义引号 / 反斜杠 / 控制字符
+            return json.dumps(v, ensure_ascii=False)
+        raise ValueError(f"Unsupported filter value: {v!r}")
+
+    @classmethod
+    def filter_expr(cls, filters):
+        if not filters:
+            return None
+
+        parts = []
+        for k, v in sorted(filters.items()):
+            if not isinstance(k, str) or not FILTER_KEY_RE.fullmatch(k):
+                raise ValueError(f"Invalid filter key: {k!r}")
+            field = k if k in ("doc_id", "modality") else f'metadata["{k}"]'
+            if isinstance(v, (list, tuple, set)):
+                if not v:
+                    raise ValueError(f"Empty filter list: {k}")
+                parts.append(f"{field} in [{', '.join(cls._filter_literal(x) for x in v)}]")
+            else:
+                parts.append(f"{field} == {cls._filter_literal(v)}")
+        return " and ".join(parts)
 
     # ------------------------------------------------------------------
     # 搜索（默认 text_vector）
     # ------------------------------------------------------------------
-    def search_text(self, query_vector, top_k=5):
+    def search_text(self, query_vector, top_k=5, search_params=None, filters=None):
+        """search_params 可按次覆盖 profile 的 ef / nprobe 等"""
 
         results = self.collection.search(
             data=[query_vector],
             anns_field="text_vector",
-            param={"metric_type": "COSINE"},
+            param=build_search_params(self.index_profile, search_params, limit=top_k),
             limit=top_k,
-            output_fields=["text", "table_blob","modality", "metadata"]
+            expr=self.filter_expr(filters),
+            output_fields=SEARCH_OUTPUT_FIELDS
         )
 
         return results[0]
@@ -327,14 +762,118 @@ class MilvusVectorStore:
     # ------------------------------------------------------------------
     # 搜索表格
     # ------------------------------------------------------------------
-    def search_table(self, query_vector, top_k=5):
+    def search_table(self, query_vector, top_k=5, search_params=None, filters=None):
 
         results = self.collection.search(
             data=[query_vector],
             anns_field="table_vector",
-            param={"metric_type": "COSINE"},
+            param=build_search_params(self.index_profile, search_params, limit=top_k),
             limit=top_k,
-            output_fields=["text",  "table_blob","modality", "metadata"]
+            expr=self.filter_expr(filters),
+            output_fields=SEARCH_OUTPUT_FIELDS
         )
 
         return results[0]
+
+
+    # ------------------------------------------------------------------
+    # 搜索线性化表格（bge-m3 query 向量，只在表格行中检索）
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _table_filters(filters):
+        return {**(filters or {}), "modality": "table"}
+
+    def search_table_text(self, query_vector, top_k=5, search_params=None, filters=None):
+
+        results = self.collection.search(
+            data=[query_vector],
+            anns_field="table_text_vector",
+            param=build_search_params(self.index_profile, search_params, limit=top_k),
+            limit=top_k,
+            expr=self.filter_expr(self._table_filters(filters)),
+            output_fields=SEARCH_OUTPUT_FIELDS
+        )
+
+        return results[0]
+
+
+    # ------------------------------------------------------------------
+    # 多向量搜索：一次请求带多个 query 向量，返回每个向量各自的 hits
+    # （供 RAGInterface.retrieve_batch 使用）
+    # ------------------------------------------------------------------
+    def search_batch(self, anns_field, query_vectors, top_k=5, search_params=None,
+                     filters=None, batch_size=None):
+        batch_size = batch_size or settings.SEARCH_BATCH_SIZE
+        if anns_field == "table_text_vector":
+            filters = self._table_filters(filters)
+
+        param = build_search_params(self.index_profile, search_params, limit=top_k)
+        expr = self.filter_expr(filters)
+
+        hits = []
+        for start in range(0, len(query_vectors), batch_size):
+            part = query_vectors[start:start + batch_size]
+            results = self.collection.search(
+                data=[np.asarray(v, dtype="float32").tolist() for v in part],
+                anns_field=anns_field,
+                param=param,
+                limit=top_k,
+                expr=expr,
+                output_fields=SEARCH_OUTPUT_FIELDS
+            )
+            hits.extend(results[i] for i in range(len(part)))
+
+        return hits
+
+
+    # ------------------------------------------------------------------
+    # 索引内存（所有已加载 segment 的 mem_size 之和，单位 bytes）
+    # ------------------------------------------------------------------
+    def index_memory(self):
+        segments = utility.get_query_segment_info(self.collection_name)
+        return sum(getattr(s, "mem_size", 0) for s in segments)
+
+
+    # ------------------------------------------------------------------
+    # 异步搜索（AsyncMilvusClient，供 RAGInterface.aretrieve 使用）
+    # 返回的每个 hit 是 dict：{"id", "distance", "entity": {...}}
+    # ------------------------------------------------------------------
+    def _get_async_client(self):
+        # AsyncMilvusClient 绑定创建时的 event loop，需在 loop 内懒加载
+        if self._async_client is None:
+            self._async_client = AsyncMilvusClient(
+                uri=f"http://{settings.MILVUS_HOST}:{settings.MILVUS_PORT}"
+            )
+        return self._async_client
+
+    async def _asearch_many(self, anns_field, query_vectors, top_k, search_params, filters):
+        results = await self._get_async_client().search(
+            collection_name=self.collection_name,
+            data=[np.asarray(v, dtype="float32").tolist() for v in query_vectors],
+            anns_field=anns_field,
+            search_params=build_search_params(self.index_profile, search_params, limit=top_k),
+            limit=top_k,
+            filter=self.filter_expr(filters) or "",
+            output_fields=SEARCH_OUTPUT_FIELDS,
+        )
+        return [results[i] for i in range(len(query_vectors))]
+
+    async def _asearch(self, anns_field, query_vector, top_k, search_params, filters):
+        return (await self._asearch_many(anns_field, [query_vector], top_k, search_params, filters))[0]
+
+    async def asearch_text(self, query_vector, top_k=5, search_params=None, filters=None):
+        return await self._asearch("text_vector", query_vector, top_k, search_params, filters)
+
+    async def asearch_table(self, query_vector, top_k=5, search_params=None, filters=None):
+        return await self._asearch("table_vector", query_vector, top_k, search_params, filters)
+
+    async def asearch_table_text(self, query_vector, top_k=5, search_params=None, filters=None):
+        return await self._asearch(
+            "table_text_vector", query_vector, top_k, search_params, self._table_filters(filters)
+        )
+
+    async def asearch_batch(self, anns_field, query_vectors, top_k=5, search_params=None, filters=None):
+        """多个 query 向量一次请求（多 query 扩展用），返回与 query_vectors 一一对应的 hits"""
+        if anns_field == "table_text_vector":
+            filters = self._table_filters(filters)
+        return await self._asearch_many(anns_field, query_vectors, top_k, search_params, filters)
@@ -0,0 +1,80 @@
+"""
+预分词 passage 存储
+
+索引时用 reranker 的 tokenizer 把每个文本块转成 token ids（不含特殊符号），
+以 int32 原始字节存入本地 SQLite；查询时 Reranker 直接取出拼接，
+省掉每次对候选 passage 重新分词。
+
+key = sha1(tokenizer 名称 + 文本)，换 reranker 模型时自然失效。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+from config.settings import settings
+
+
+class PassageTokenStore:
+
+    def __init__(self, model_name: str = None, path: str = None):
+        self.model_name = model_name or settings.RERANKER_MODEL
+        self.path = path or settings.PASSAGE_TOKEN_DB
+
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS passage_tokens ("
+            " key TEXT PRIMARY KEY,"
+            " ids BLOB NOT NULL"
+            ")"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def reopen(self):
+        """fork 之后在子进程中调用：SQLite 连接不能跨进程共享"""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def put_many(self, texts, token_ids):
+        """texts 与 token_ids 一一对应"""
+        rows = [
+            (self.key(t), sqlite3.Binary(array("i", ids).tobytes()))
+            for t, ids in zip(texts, token_ids)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO passage_tokens (key, ids) VALUES (?, ?)", rows
+            )
+            self._conn.commit()
+
+    def get_many(self, texts):
+        """返回 {text: [token ids]}，未预分词的文本不出现在结果里"""
+        by_key = {self.key(t): t for t in texts}
+        if not by_key:
+            return {}
+
+        found = {}
+        keys = list(by_key)
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                for key, blob in self._conn.execute(
+                    f"SELECT key, ids FROM passage_tokens WHERE key IN ({marks})", part
+                ):
+                    ids = array("i")
+                    ids.frombytes(bytes(blob))
+                    found[by_key[key]] = ids.tolist()
+        return found
@@ -0,0 +1,86 @@
+"""
+retrieve() → pack_context() 端到端：同一页的两个文本块 + 一个表格都要进入上下文
+
+Milvus / 模型都换成内存里的假实现，只验证融合与拼接逻辑。
+"""
+
+import pytest
+
+import retrieval.retriever as retriever_module
+from retrieval.context_packer import pack_context
+from retrieval.retriever import RAGInterface
+
+META = {"source": "policy.pdf", "page_number": 3}
+
+CHUNK_A = "w1 w2 w3 w4 w5 w6 w7 w8 w9 w10"
+CHUNK_B = "w6 w7 w8 w9 w10 w11 w12 w13 w14 w15"      # 与 CHUNK_A 重叠 5 个词
+TABLE = {"header": ["险种", "保额"], "rows": [["意外", "10万"]]}
+
+
+def _hit(chunk_id, modality, text="", table_digest=""):
+    return {
+        "id": chunk_id,
+        "entity": {
+            "text": text,
+            "table_digest": table_digest,
+            "modality": modality,
+            "metadata": dict(META),
+        },
+    }
+
+
+class FakeEmbedder:
+    def load_table_model(self):
+        pass
+
+    def embed_text(self, texts):
+        return [[0.0] * 4 for _ in texts]
+
+    def embed_query_table(self, query):
+        return [0.0] * 4
+
+
+class FakeStore:
+    has_table_text = False
+
+    def refresh(self):
+        pass
+
+    def search_text(self, q_vec, top_k=5, filters=None):
+        return [_hit(1, "text", text=CHUNK_A), _hit(2, "text", text=CHUNK_B)]
+
+    def search_table(self, q_vec, top_k=5, filters=None):
+        return [_hit(3, "table", table_digest="t1")]
+
+
+class FakeBlobStore:
+    def get_table(self, digest):
+        return TABLE if digest == "t1" else None
+
+
+class FakeReranker:
+    def rerank(self, query, texts, ids=None):
+        return [float(len(texts) - i) for i in range(len(texts))]
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    monkeypatch.setattr(retriever_module, "Embedder", FakeEmbedder)
+    monkeypatch.setattr(retriever_module, "MilvusVectorStore", FakeStore)
+    monkeypatch.setattr(retriever_module, "TableBlobStore", FakeBlobStore)
+    monkeypatch.setattr(retriever_module, "Reranker", FakeReranker)
+    monkeypatch.setattr(retriever_module.settings, "TABLE_QUERY_MODE", "tapas")
+    monkeypatch.setattr(retriever_module.settings, "QUERY_EXPANSION", "off")
+    return RAGInterface(w_bm25=0)
+
+
+def test_same_page_chunks_and_table_reach_context(rag):
+    results = rag.retrieve("意外保额", top_k=5)
+
+    assert sorted(r["id"] for r in results) == [1, 2, 3]
+
+    blocks = pack_context(results)
+    assert blocks == [
+        "w1 w2 w3 w4 w5 w6 w7 w8 w9 w10 w11 w12 w13 w14 w15",
+        "险种 | 保额\n意外 | 10万",
+    ]
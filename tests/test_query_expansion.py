@@ -0,0 +1,29 @@
+"""
+规则改写（QUERY_EXPANSION=rules）：口语问题要产生改写，条款用语不能被二次改写
+"""
+
+from retrieval.query_expansion import QueryExpander
+
+
+def _rules():
+    return QueryExpander(mode="rules", max_variants=3)
+
+
+def test_interrogative_question_expands():
+    variants = _rules().expand("如何申请意外医疗保险理赔？")
+
+    assert variants[0] == "如何申请意外医疗保险理赔？"
+    assert len(variants) > 1
+    assert "申请意外医疗保险理赔" in variants
+
+
+def test_question_phrase_rewritten_as_a_whole():
+    variants = _rules().expand("理赔需要多久？")
+
+    assert "理赔所需时间？" in variants
+    assert not any("期限" in v for v in variants)
+
+
+def test_formal_terms_left_intact():
+    for query in ("意外伤害保险", "住院医疗保险理赔", "意外医疗保险", "购买重疾险需要投保年龄"):
+        assert _rules().expand(query) == [query]